@@ -1,76 +1,165 @@
+import asyncio
+import heapq
 import json
 import logging
-import re
 from dataclasses import dataclass
+from typing import Literal
 
+from sqlalchemy import func, select
 from sqlalchemy.orm import sessionmaker
 
-from models import BaseEngineSql, TokenizationVacancy
+from http_clients import client_session
+from models import AsyncSessionSql, BaseEngineSql, TokenFrequency, TokenizationVacancy
 from my_preferences import PreferencePoints
+from nlp.interface_client import (
+    client_api_text_to_tokens,
+    client_api_text_to_tokens_async,
+)
+from phrase_matcher import PhraseMatcher
 from receive_data import TokenizationResumeAndVacancies
+from scoring import Scorer, get_scoring_engine
+from token_index import find_phrase
+from utils import ResumeTokens
 
 logger = logging.getLogger(__name__)
 
+# Автомат для поиска предпочтений по словосочетаниям, строится один раз
+preference_phrase_matcher = PhraseMatcher.from_preferences()
+
 
 @dataclass
 class ResponseSearch:
     vacancy_id: int
     score: float
     score_preference: float
-    common_tokens: str
-    missing_tokens: str
-    job: str
-    job_text: str
+    common_tokens: str | None = None
+    missing_tokens: str | None = None
+    job: str | None = None
+    job_text: str | None = None
+
 
+def search_db_for_jobs_that_fit_my_resume(
+    limit: int = 100,
+    scorer: Scorer = "overlap",
+    offset: int = 0,
+    include_text: bool = True,
+    include_tokens: bool = True,
+) -> list[ResponseSearch]:
+    """Поиск вакансий которые подходят под мое резюме.
 
-def search_db_for_jobs_that_fit_my_resume(limit: int = 100) -> list[ResponseSearch]:
-    """Поиск вакансий которые подходят под мое резюме."""
+    - overlap - доля токенов вакансии, которые есть в резюме
+    - tfidf - косинусная близость TF-IDF векторов резюме и вакансии
+    - bm25 - оценка BM25 вакансии по токенам резюме
 
-    resume_tokens = TokenizationResumeAndVacancies.resume()
+    Для всех вакансий считаются только оценки, ответ с токенами и текстом
+    собирается только для вакансий страницы `offset`, `limit`.
+    """
+
+    resume = TokenizationResumeAndVacancies.resume_cached()
     (
         job_descriptions_tokens,
         job_descriptions,
-    ) = TokenizationResumeAndVacancies.job_descriptions()
+    ) = TokenizationResumeAndVacancies.stored_job_descriptions()
+    return rank_vacancies(
+        resume,
+        job_descriptions_tokens,
+        job_descriptions,
+        limit,
+        scorer,
+        offset,
+        include_text,
+        include_tokens,
+    )
 
-    response = []
-    for id_, job in job_descriptions_tokens.items():
-        common_tokens: set = set(resume_tokens).intersection(set(job))
-        missing_tokens: set = set(job) - set(resume_tokens)
-        score = len(common_tokens) / len(job) if job else 0
-        score_preference: float = score
 
-        # Прибавляем или отнимаем баллы по предпочтениям словам
-        for token in job:
-            if score_word := PreferencePoints.SCORE_LIKE.get(token):
-                score_preference += float(score_word)
+async def search_db_for_jobs_that_fit_my_resume_async(
+    limit: int = 100,
+    scorer: Scorer = "overlap",
+    offset: int = 0,
+    include_text: bool = True,
+    include_tokens: bool = True,
+) -> list[ResponseSearch]:
+    """
+    Асинхронная версия `search_db_for_jobs_that_fit_my_resume`.
+
+    Оценка вакансий выполняется в отдельном потоке, чтобы не блокировать цикл событий.
+    """
+    resume = await TokenizationResumeAndVacancies.resume_cached_async()
+    (
+        job_descriptions_tokens,
+        job_descriptions,
+    ) = await TokenizationResumeAndVacancies.stored_job_descriptions_async()
+    return await asyncio.to_thread(
+        rank_vacancies,
+        resume,
+        job_descriptions_tokens,
+        job_descriptions,
+        limit,
+        scorer,
+        offset,
+        include_text,
+        include_tokens,
+    )
 
+
+def rank_vacancies(
+    resume: ResumeTokens,
+    job_descriptions_tokens: dict[int, list[str]],
+    job_descriptions: dict[int, str],
+    limit: int = 100,
+    scorer: Scorer = "overlap",
+    offset: int = 0,
+    include_text: bool = True,
+    include_tokens: bool = True,
+) -> list[ResponseSearch]:
+    """
+    Оценить вакансии по резюме и собрать страницу ответа.
+
+    Оценки всех вакансий кешируются вместе с токенами резюме
+    и пересчитываются только при изменении резюме или вакансий.
+    """
+    engine = get_scoring_engine(job_descriptions_tokens)
+
+    def compute_scores() -> tuple[dict[int, float], dict[int, float]]:
+        scores = engine.score(resume.tokens, scorer)
+        # Прибавляем или отнимаем баллы по предпочтениям словам
+        scores_like = engine.weighted_counts(PreferencePoints.SCORE_LIKE)
         # Прибавляем или отнимаем баллы по предпочтениям словосочетаниям
-        job_str = ",".join(map(str, job))
-        for phrases in PreferencePoints.SCORE_LIKE_PHRASE:
-            for phrase in phrases.phrase:
-                # Преобразуем списки в строки
-                sub_str = ",".join(map(str, phrase))
-                # Поиск подстроки в строке
-                if sub_str in job_str:
-                    score_preference += float(phrases.score)
-
-        response.append(
-            ResponseSearch(
-                vacancy_id=id_,
-                score=score,
-                score_preference=score_preference,
-                common_tokens=json.dumps(list(common_tokens), ensure_ascii=False),
-                missing_tokens=json.dumps(list(missing_tokens), ensure_ascii=False),
-                job=json.dumps(list(job), ensure_ascii=False),
-                job_text=job_descriptions[id_],
-            )
-        )
-    sort_response = sorted(response, key=lambda x: x.score_preference, reverse=True)
+        scores_preference: dict[int, float] = {
+            id_: scores[id_] + scores_like[id_] + preference_phrase_matcher.score(job)
+            for id_, job in job_descriptions_tokens.items()
+        }
+        return scores, scores_preference
+
+    scores, scores_preference = resume.cached_scores(engine, scorer, compute_scores)
 
+    # Выбираем только вакансии страницы, без сортировки всех вакансий
+    ranked = scores_preference.items()
     if limit > 0:
-        return sort_response[:limit]
+        page = heapq.nlargest(offset + limit, ranked, key=lambda x: x[1])
     else:
-        return sort_response
+        page = sorted(ranked, key=lambda x: x[1], reverse=True)
+    page = page[offset:]
+
+    resume_tokens_set = resume.tokens_set
+    response = []
+    for id_, score_preference in page:
+        job = job_descriptions_tokens[id_]
+        item = ResponseSearch(
+            vacancy_id=id_,
+            score=scores[id_],
+            score_preference=score_preference,
+        )
+        if include_tokens:
+            common_tokens: set = resume_tokens_set.intersection(job)
+            missing_tokens: set = set(job) - resume_tokens_set
+            item.common_tokens = json.dumps(list(common_tokens), ensure_ascii=False)
+            item.missing_tokens = json.dumps(list(missing_tokens), ensure_ascii=False)
+            item.job = json.dumps(list(job), ensure_ascii=False)
+        if include_text:
+            item.job_text = job_descriptions[id_]
+        response.append(item)
+    return response
 
 
 @dataclass
@@ -80,6 +169,12 @@ class SortedTokensCount:
     count_p: float
 
 
+# Язык слов: только английские или все
+Lang = Literal["eng", "all"]
+# Токены, которых нет в резюме, или токены, которые есть в резюме
+TypeToken = Literal["missing_token", "common_tokens"]
+
+
 @dataclass
 class ResponseFrequentSkills:
     type_token: str
@@ -87,61 +182,137 @@ class ResponseFrequentSkills:
     message: list[SortedTokensCount]
 
 
-def find_out_the_statistics_of_frequent_skills(lang: str, type_token: str):
+def find_out_the_statistics_of_frequent_skills(
+    lang: Lang, type_token: TypeToken, limit: int = 200
+):
     """
     Статистика частых скилов в вакансиях:
 
     - Которых у есть в резюме (type_token=common_tokens)
     - Которых у меня нет в резюме (type_token=missing_token)
-    """
-
-    tokens_count: dict[str, int] = {}
-    all_count = 0
 
+    Частота берётся из таблицы `token_frequency`,
+    которая обновляется при токенизации вакансий.
+    """
+    all_count_query, tokens_query = frequent_skills_queries(lang, type_token, limit)
     Session = sessionmaker(bind=BaseEngineSql)
     with Session() as session:
-        rows = session.query(TokenizationVacancy).all()
-        for row in rows:
-            if type_token == "common_tokens":
-                if not row.common_tokens:
-                    continue
-                common_tokens_row = json.loads(row.common_tokens)
-                for m in common_tokens_row:
-                    tokens_count[m] = tokens_count.get(m, 0) + 1
-            elif type_token == "missing_token":
-                if not row.missing_tokens:
-                    continue
-                missing_token_row = json.loads(row.missing_tokens)
-                for m in missing_token_row:
-                    tokens_count[m] = tokens_count.get(m, 0) + 1
-            all_count += 1
-
-    # Отсортировать missing_tokens_count
-    sorted_tokens_count = sorted(tokens_count.items(), key=lambda x: x[1], reverse=True)
-    message = []
+        all_count = session.scalar(all_count_query)
+        rows = session.execute(tokens_query).all()
+    return frequent_skills_response(type_token, all_count, rows)
+
+
+async def find_out_the_statistics_of_frequent_skills_async(
+    lang: Lang, type_token: TypeToken, limit: int = 200
+):
+    """Асинхронная версия `find_out_the_statistics_of_frequent_skills`"""
+    all_count_query, tokens_query = frequent_skills_queries(lang, type_token, limit)
+    async with AsyncSessionSql() as session:
+        all_count = await session.scalar(all_count_query)
+        rows = (await session.execute(tokens_query)).all()
+    return frequent_skills_response(type_token, all_count, rows)
+
+
+def frequent_skills_queries(lang: Lang, type_token: TypeToken, limit: int):
+    """Запросы количества вакансий и самых частых токенов"""
+    # Количество токенов записывается вместе с токенами,
+    # поэтому вакансии с токенами считаются по небольшому индексу
+    if type_token == "common_tokens":
+        len_column = TokenizationVacancy.len_common_tokens
+        count_column = TokenFrequency.common_count
+    else:
+        len_column = TokenizationVacancy.len_missing_tokens
+        count_column = TokenFrequency.missing_count
+
+    all_count_query = (
+        select(func.count())
+        .select_from(TokenizationVacancy)
+        .where(len_column.isnot(None))
+    )
+    tokens_query = (
+        select(TokenFrequency.token, count_column)
+        .where(count_column > 0)
+        .order_by(count_column.desc())
+        .limit(limit)
+    )
     if lang == "eng":
         # Только слова на английском
-        message = [
-            SortedTokensCount(
-                name=k,
-                count=v,
-                count_p=round((v / all_count) * 100, 2),
-            )
-            for k, v in sorted_tokens_count
-            if re.match(r"[a-zA-Z]", k)
-        ]
-    else:
-        message = [
-            SortedTokensCount(
-                name=k,
-                count=v,
-                count_p=round((v / all_count) * 100, 2),
-            )
-            for k, v in sorted_tokens_count
-        ]
+        tokens_query = tokens_query.where(TokenFrequency.lang == "eng")
+    return all_count_query, tokens_query
+
+
+def frequent_skills_response(
+    type_token: str, all_count: int, rows
+) -> ResponseFrequentSkills:
+    message = [
+        SortedTokensCount(
+            name=token,
+            count=count,
+            count_p=round((count / all_count) * 100, 2),
+        )
+        for token, count in rows
+    ]
 
     return ResponseFrequentSkills(
         type_token=type_token,
         all_count=all_count,
-        message=message[:200],
+        message=message,
+    )
+
+
+@dataclass
+class ResponseTokenSearch:
+    vacancy_id: int
+    count: int
+    positions: list[int]
+
+
+def search_vacancies_by_tokens(
+    query: str, tokenize: bool = True, limit: int = 100
+) -> list[ResponseTokenSearch]:
+    """
+    Поиск вакансий по токену или словосочетанию через инвертированный индекс.
+
+    - Если `tokenize=True`, то `query` - обычный текст, он токенизируется NLP сервером
+    - Если `tokenize=False`, то `query` - токены через пробел
+    """
+    phrase = client_api_text_to_tokens(query) if tokenize else query.split()
+
+    Session = sessionmaker(bind=BaseEngineSql)
+    with Session() as session:
+        found = find_phrase(session, phrase)
+    return token_search_response(found, limit)
+
+
+async def search_vacancies_by_tokens_async(
+    query: str, tokenize: bool = True, limit: int = 100
+) -> list[ResponseTokenSearch]:
+    """Асинхронная версия `search_vacancies_by_tokens`"""
+    if tokenize:
+        async with client_session("nlp") as session:
+            phrase = await client_api_text_to_tokens_async(query, session)
+    else:
+        phrase = query.split()
+
+    async with AsyncSessionSql() as session:
+        found = await session.run_sync(find_phrase, phrase)
+    return token_search_response(found, limit)
+
+
+def token_search_response(
+    found: dict[int, list[int]], limit: int
+) -> list[ResponseTokenSearch]:
+    response = sorted(
+        (
+            ResponseTokenSearch(
+                vacancy_id=vacancy_id, count=len(positions), positions=positions
+            )
+            for vacancy_id, positions in found.items()
+        ),
+        key=lambda x: x.count,
+        reverse=True,
     )
+    if limit > 0:
+        return response[:limit]
+    else:
+        return response
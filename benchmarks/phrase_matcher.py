@@ -0,0 +1,103 @@
+"""
+Сравнение поиска словосочетаний-предпочтений в токенах вакансий:
+поиск подстроки в строке токенов через запятую и автомат `PhraseMatcher`.
+
+Корпус - токены вакансий из БД, словосочетания - случайные n-граммы из этих же токенов.
+
+python -m benchmarks.phrase_matcher
+"""
+
+import argparse
+import random
+import time
+
+from sqlalchemy.orm import sessionmaker
+
+from models import BaseEngineSql, TokenizationVacancy, decode_tokens, token_texts
+from phrase_matcher import PhraseMatcher
+
+
+def score_substring(phrases: list[tuple[list[str], float]], job: list[str]) -> float:
+    """Прежняя реализация: поиск подстроки в токенах, соединенных через запятую"""
+    score = 0.0
+    job_str = ",".join(map(str, job))
+    for phrase, phrase_score in phrases:
+        if ",".join(map(str, phrase)) in job_str:
+            score += phrase_score
+    return score
+
+
+def load_corpus(limit: int) -> list[list[str]]:
+    Session = sessionmaker(bind=BaseEngineSql)
+    with Session() as session:
+        texts = token_texts(session)
+        return [
+            decode_tokens(row[0], texts)
+            for row in session.query(TokenizationVacancy.token_ids)
+            .filter(TokenizationVacancy.token_ids.isnot(None))
+            .limit(limit)
+        ]
+
+
+def random_phrases(
+    corpus: list[list[str]], count: int
+) -> list[tuple[list[str], float]]:
+    """Случайные словосочетания из 1-4 токенов, взятые из корпуса"""
+    phrases = []
+    jobs = [job for job in corpus if job]
+    while len(phrases) < count:
+        job = random.choice(jobs)
+        length = random.randint(1, min(4, len(job)))
+        start = random.randint(0, len(job) - length)
+        phrases.append((job[start : start + length], random.choice([-100, -1, 1])))
+    return phrases
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--limit", type=int, default=2000, help="Количество вакансий")
+    parser.add_argument(
+        "--phrases",
+        type=int,
+        nargs="+",
+        default=[5, 50, 200, 500, 1000],
+        help="Количество словосочетаний",
+    )
+    args = parser.parse_args()
+
+    random.seed(0)
+    corpus = load_corpus(args.limit)
+    if not corpus:
+        print("В БД нет токенов вакансий, сначала выполните токенизацию")
+        return
+    print(f"Vacancies: {len(corpus)}")
+
+    for count in args.phrases:
+        phrases = random_phrases(corpus, count)
+
+        start = time.perf_counter()
+        for job in corpus:
+            score_substring(phrases, job)
+        substring_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        matcher = PhraseMatcher(phrases)
+        build_time = time.perf_counter() - start
+        start = time.perf_counter()
+        for job in corpus:
+            matcher.score(job)
+        matcher_time = time.perf_counter() - start
+
+        # Подстрока может совпасть на границе токенов, автомат - нет
+        differ = sum(
+            score_substring(phrases, job) != matcher.score(job) for job in corpus
+        )
+        print(
+            f"phrases {count:>5}: substring {substring_time:.3f} s, "
+            f"matcher {matcher_time:.3f} s (build {build_time:.3f} s), "
+            f"differ {differ} vacancies"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Планы запросов (`EXPLAIN QUERY PLAN`) для запросов приложения к БД.
+
+Запросы выполняются на копии БД, поэтому запросы записи не меняют данные.
+Все SQL запросы перехватываются через событие `before_cursor_execute`,
+для каждого уникального запроса выводится его план.
+Строки плана `SCAN` без индекса - полный просмотр таблицы.
+
+python -m benchmarks.query_plans
+"""
+
+import argparse
+import re
+import sqlite3
+import tempfile
+from pathlib import Path
+
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.orm import Session
+
+from analytics import (
+    find_out_the_statistics_of_frequent_skills,
+    search_vacancies_by_tokens,
+)
+from models import (
+    BaseEngineSql,
+    CrawlState,
+    TokenizationVacancy,
+    Vacancy,
+    bulk_upsert,
+    decode_tokens,
+    init_db,
+    token_texts,
+)
+from receive_data import (
+    crawl_pending_ids,
+    load_by_ids,
+    load_tokenization_state,
+    load_vacancies_published_at,
+    save_crawl_state,
+    update_vacancy_skills,
+)
+from settings_app import crawl_max_attempts, vacancies_db_path
+from token_frequency import (
+    is_token_frequency_empty,
+    rebuild_token_frequency,
+    update_token_frequency,
+)
+from token_index import find_phrase, indexed_vacancy_ids, update_token_index
+from utils import load_stored_job_tokens, stored_tokens_version
+
+_SKIP_RE = re.compile(r"^\s*(PRAGMA|BEGIN|COMMIT|ROLLBACK|SAVEPOINT|RELEASE)", re.I)
+_FULL_SCAN_RE = re.compile(r"^SCAN (?!.*USING (COVERING )?INDEX)")
+
+
+def capture_statements(engine, statements: dict[str, tuple]):
+    """Сохранять каждый уникальный SQL запрос `engine` с параметрами первого вызова"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if _SKIP_RE.match(statement):
+            return
+        if executemany:
+            parameters = parameters[0] if parameters else ()
+        statements.setdefault(statement, parameters)
+
+    return capture
+
+
+def run_app_queries(session: Session, sample_size: int):
+    """Выполнить запросы чтения и записи приложения на выборке вакансий"""
+    # Загрузка вакансий
+    crawl_pending_ids(session, crawl_max_attempts)
+    sample_ids = [
+        id_ for (id_,) in session.execute(select(Vacancy.id).limit(sample_size))
+    ]
+    load_vacancies_published_at(sample_ids)
+    load_by_ids(
+        [CrawlState.id, CrawlState.listed_published_at], CrawlState.id, sample_ids
+    )
+    vacancies = [
+        {
+            column.name: getattr(vacancy, column.name)
+            for column in Vacancy.__table__.columns
+        }
+        for vacancy in session.scalars(
+            select(Vacancy).where(Vacancy.id.in_(sample_ids))
+        )
+    ]
+    bulk_upsert(session, Vacancy, vacancies, before_write=update_vacancy_skills)
+    save_crawl_state(session, sample_ids[1:], {sample_ids[0]: "error"})
+
+    # Токенизация
+    texts = token_texts(session)
+    load_tokenization_state(session)
+    indexed_vacancy_ids(session)
+    tokenization = [
+        {
+            column.name: getattr(row, column.name)
+            for column in TokenizationVacancy.__table__.columns
+        }
+        for row in session.scalars(
+            select(TokenizationVacancy).where(TokenizationVacancy.id.in_(sample_ids))
+        )
+    ]
+    if is_token_frequency_empty(session):
+        rebuild_token_frequency(session)
+    bulk_upsert(
+        session,
+        TokenizationVacancy,
+        tokenization,
+        before_write=update_token_frequency,
+    )
+    job_tokens = {
+        row["id"]: decode_tokens(row["token_ids"], texts) for row in tokenization
+    }
+    update_token_index(session, job_tokens)
+
+    # Анализ
+    stored_tokens_version(session)
+    load_stored_job_tokens(session)
+    phrase = next((tokens[:2] for tokens in job_tokens.values() if tokens), [])
+    find_phrase(session, phrase)
+    search_vacancies_by_tokens(" ".join(phrase), tokenize=False)
+    for lang in ("eng", "all"):
+        for type_token in ("missing_token", "common_tokens"):
+            find_out_the_statistics_of_frequent_skills(lang, type_token)
+
+
+def print_plans(path: Path, statements: dict[str, tuple]) -> int:
+    """Вывести планы запросов, возвращает количество запросов с полным просмотром"""
+    full_scans = 0
+    with sqlite3.connect(path) as conn:
+        for number, (statement, parameters) in enumerate(statements.items(), 1):
+            plan = conn.execute(
+                f"EXPLAIN QUERY PLAN {statement}", parameters
+            ).fetchall()
+            details = [row[-1] for row in plan]
+            has_full_scan = any(_FULL_SCAN_RE.match(detail) for detail in details)
+            full_scans += has_full_scan
+            print(f"-- {number}.{' FULL SCAN' if has_full_scan else ''}")
+            print(" ".join(statement.split()))
+            for detail in details:
+                print(f"    {detail}")
+            print()
+    return full_scans
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--sample", type=int, default=50, help="Количество вакансий в запросах"
+    )
+    args = parser.parse_args()
+
+    statements: dict[str, tuple] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / vacancies_db_path.name
+        with sqlite3.connect(vacancies_db_path) as source, sqlite3.connect(
+            path
+        ) as target:
+            source.backup(target)
+
+        engine = create_engine(f"sqlite:///{path}")
+        init_db(engine)
+        capture_statements(engine, statements)
+        # Функции, которые сами открывают сессию, только читают из БД
+        capture_statements(BaseEngineSql, statements)
+        with Session(engine) as session:
+            run_app_queries(session, args.sample)
+        engine.dispose()
+
+        full_scans = print_plans(path, statements)
+    print(f"Queries: {len(statements)}, with full table scan: {full_scans}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Сравнение скорости стемминга токенов до и после кеширования.
+
+Корпус - описания вакансий из БД.
+
+python -m benchmarks.stem_tokens
+"""
+
+import argparse
+import re
+import time
+
+from nltk.tokenize import word_tokenize
+from sqlalchemy.orm import sessionmaker
+
+from models import BaseEngineSql, Vacancy
+from nlp.nltk_logic import CustomNltk
+
+
+def stem_tokens_baseline(nltk_processor: CustomNltk, tokens: list[str]) -> list[str]:
+    """Прежняя реализация `CustomNltk._stem_tokens`, без кеша и с `re.match`"""
+    stemmed_tokens = []
+    for token in tokens:
+        if re.match(r"^\d+$", token):
+            stemmed_tokens.append(token)
+        elif re.match(r"[а-яА-ЯёЁ]", token):
+            stemmed_tokens.append(nltk_processor.russian_stemmer.stem(token))
+        elif re.match(r"[a-zA-Z]", token):
+            stemmed_tokens.append(nltk_processor.english_stemmer.stem(token))
+        else:
+            stemmed_tokens.append(token)
+    return stemmed_tokens
+
+
+def load_corpus(limit: int) -> list[list[str]]:
+    """Токены описаний вакансий (до стемминга)"""
+    Session = sessionmaker(bind=BaseEngineSql)
+    with Session() as session:
+        descriptions = [
+            row[0]
+            for row in session.query(Vacancy.description)
+            .filter(Vacancy.description.isnot(None))
+            .limit(limit)
+        ]
+    return [
+        word_tokenize(CustomNltk._clean_text(description.lower()))
+        for description in descriptions
+    ]
+
+
+def measure(name: str, stem, corpus: list[list[str]]) -> list[list[str]]:
+    count_tokens = sum(len(tokens) for tokens in corpus)
+    start = time.perf_counter()
+    result = [stem(tokens) for tokens in corpus]
+    elapsed = time.perf_counter() - start
+    print(
+        f"{name:<10} {count_tokens} tokens, {elapsed:.3f} s, "
+        f"{count_tokens / elapsed:,.0f} tokens/s"
+    )
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--limit", type=int, default=2000, help="Количество вакансий")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.limit)
+    if not corpus:
+        print("В БД нет вакансий, сначала загрузите их через API hh.ru")
+        return
+    print(f"Vacancies: {len(corpus)}")
+
+    nltk_processor = CustomNltk()
+    before = measure(
+        "before", lambda tokens: stem_tokens_baseline(nltk_processor, tokens), corpus
+    )
+    after = measure("after", CustomNltk(download=False)._stem_tokens, corpus)
+    assert before == after, "Результат стемминга отличается"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Общие HTTP клиенты приложения.
+
+Сессии `aiohttp` с пулом keep-alive соединений создаются один раз при запуске
+API сервера и закрываются при его остановке, поэтому соединения с NLP сервером
+и API hh.ru переиспользуются между запросами.
+
+Сессия привязана к циклу событий, в котором создана, поэтому общие сессии
+хранятся отдельно для каждого цикла. Синхронный код (фоновые задачи) запускает
+корутины через `run_sync` в собственном цикле со своими сессиями и не занимает
+цикл API сервера. Корутины из цикла без общих сессий получают временную сессию.
+"""
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Literal, TypeVar
+
+import aiohttp
+
+from settings_app import (
+    hh_max_concurrency,
+    hh_request_timeout,
+    http_connection_limit,
+    http_keepalive_timeout,
+    nlp_max_connections,
+    nlp_request_timeout,
+)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+ClientName = Literal["nlp", "hh"]
+
+# Максимальное количество соединений с хостом и таймаут запроса для каждого клиента
+CLIENT_SETTINGS: dict[ClientName, tuple[int, float]] = {
+    "nlp": (nlp_max_connections, nlp_request_timeout),
+    "hh": (hh_max_concurrency, hh_request_timeout),
+}
+
+
+def create_session(name: ClientName) -> aiohttp.ClientSession:
+    """Новая сессия с пулом соединений по настройкам клиента `name`"""
+    limit_per_host, timeout = CLIENT_SETTINGS[name]
+    connector = aiohttp.TCPConnector(
+        limit=http_connection_limit,
+        limit_per_host=limit_per_host,
+        keepalive_timeout=http_keepalive_timeout,
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=timeout, sock_connect=10),
+    )
+
+
+class HttpClients:
+    """Сессии, которые живут всё время работы цикла событий (API сервера или фоновой задачи)"""
+
+    def __init__(self):
+        self._sessions: dict[
+            asyncio.AbstractEventLoop, dict[ClientName, aiohttp.ClientSession]
+        ] = {}
+
+    async def start(self):
+        """Создать общие сессии для текущего цикла событий"""
+        loop = asyncio.get_running_loop()
+        self._sessions[loop] = {name: create_session(name) for name in CLIENT_SETTINGS}
+        logger.debug("HTTP clients started")
+
+    async def close(self):
+        """Закрыть общие сессии текущего цикла событий"""
+        sessions = self._sessions.pop(asyncio.get_running_loop(), {})
+        for session in sessions.values():
+            await session.close()
+        logger.debug("HTTP clients closed")
+
+    def shared(self, name: ClientName) -> aiohttp.ClientSession | None:
+        """Общая сессия текущего цикла событий, если она создана"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return None
+        return self._sessions.get(loop, {}).get(name)
+
+
+http_clients = HttpClients()
+
+
+@asynccontextmanager
+async def client_session(name: ClientName) -> AsyncIterator[aiohttp.ClientSession]:
+    """Общая сессия клиента `name`, или временная, если общая недоступна"""
+    session = http_clients.shared(name)
+    if session is not None:
+        yield session
+        return
+    async with create_session(name) as session:
+        yield session
+
+
+def run_sync(func: Callable[[], Awaitable[T]]) -> T:
+    """
+    Выполнить корутину `func()` из синхронного кода.
+
+    Корутина выполняется в новом цикле событий через `asyncio.run` с общими
+    сессиями этого цикла, поэтому соединения переиспользуются внутри задачи,
+    а цикл API сервера не занимается её работой.
+    Нельзя вызывать из потока с запущенным циклом событий.
+    """
+
+    async def run() -> T:
+        await http_clients.start()
+        try:
+            return await func()
+        finally:
+            await http_clients.close()
+
+    return asyncio.run(run())
@@ -0,0 +1,122 @@
+"""
+Фоновые задачи для долгих операций: загрузка вакансий из API hh.ru и токенизация.
+
+Задачи выполняются по одной в отдельном потоке, поэтому два конвейера
+никогда не работают с файлом БД одновременно.
+Повторный запуск задачи, которая ещё ждёт или выполняется, не создаёт новую задачу,
+а возвращает уже существующую.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+# Отчёт о прогрессе: этап, обработано, всего (None - неизвестно)
+Progress = Callable[[str, int, int | None], None]
+
+
+@dataclass
+class Job:
+    id: str
+    name: str
+    # pending - ждёт выполнения, running - выполняется, done - готово, failed - ошибка
+    status: str = "pending"
+    stage: str | None = None  # Текущий этап
+    processed: int = 0  # Обработано на текущем этапе
+    total: int | None = None  # Всего на текущем этапе
+    throughput: float = 0  # Обработано в секунду на текущем этапе
+    error: str | None = None
+    created_at: datetime = field(default_factory=datetime.now)
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+
+    def __post_init__(self):
+        self._stage_start = time.perf_counter()
+
+    def progress(self, stage: str, processed: int, total: int | None = None):
+        """Обновить прогресс, вызывается из функций конвейера"""
+        if stage != self.stage:
+            self.stage = stage
+            self._stage_start = time.perf_counter()
+        self.processed = processed
+        self.total = total
+        elapsed = time.perf_counter() - self._stage_start
+        self.throughput = round(processed / elapsed, 2) if elapsed else 0
+
+
+class JobRunner:
+    """
+    Очередь фоновых задач, которые выполняются по одной.
+
+    Хранит последние `max_history` задач для просмотра статуса.
+    """
+
+    def __init__(self, max_history: int = 100):
+        self.max_history = max_history
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job")
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(
+        self, name: str, func: Callable[..., Any], *args, **kwargs
+    ) -> tuple[Job, bool]:
+        """
+        Поставить задачу `name` в очередь.
+
+        `func` вызывается с аргументом `progress` для отчёта о прогрессе.
+        Если задача `name` уже ждёт или выполняется, то возвращается она.
+        Возвращает задачу и признак, что задача создана.
+        """
+        with self._lock:
+            for job in self._jobs.values():
+                if job.name == name and job.status in ("pending", "running"):
+                    return job, False
+            job = Job(id=uuid.uuid4().hex, name=name)
+            self._jobs[job.id] = job
+            self._trim()
+        self._executor.submit(self._run, job, func, args, kwargs)
+        logger.info(f"Job {job.name} {job.id} queued")
+        return job, True
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self) -> list[Job]:
+        with self._lock:
+            return list(reversed(self._jobs.values()))
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, job: Job, func: Callable[..., Any], args, kwargs):
+        job.status = "running"
+        job.started_at = datetime.now()
+        logger.info(f"Job {job.name} {job.id} started")
+        try:
+            func(*args, progress=job.progress, **kwargs)
+            job.status = "done"
+        except Exception as e:
+            logger.exception(f"Job {job.name} {job.id} failed")
+            job.status = "failed"
+            job.error = repr(e)
+        job.finished_at = datetime.now()
+        logger.info(f"Job {job.name} {job.id} {job.status}")
+
+    def _trim(self):
+        """Удалить самые старые завершённые задачи сверх `max_history`"""
+        finished = [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job.status in ("done", "failed")
+        ]
+        for job_id in finished[: max(0, len(self._jobs) - self.max_history)]:
+            del self._jobs[job_id]
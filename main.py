@@ -2,25 +2,48 @@
 Файл с API сервером получения и анализирования вакансий
 """
 
-from fastapi import FastAPI, Query
+import asyncio
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.staticfiles import StaticFiles
 
 from analytics import (
+    Lang,
     ResponseFrequentSkills,
     ResponseSearch,
-    find_out_the_statistics_of_frequent_skills,
-    search_db_for_jobs_that_fit_my_resume,
+    ResponseTokenSearch,
+    TypeToken,
+    find_out_the_statistics_of_frequent_skills_async,
+    search_db_for_jobs_that_fit_my_resume_async,
+    search_vacancies_by_tokens_async,
 )
+from http_clients import http_clients
+from jobs import Job, JobRunner, Progress
+from models import AsyncEngineSql, init_db
 from my_preferences import CURRENCY, SALARY, SCHEDULE, TARGET_TEXT_SEARCH
 from receive_data import (
-    converting_vacancies_by_db,
     get_job_text_from_hh_api,
     get_list_vacancies_from_hh_api,
     tokenize_vacancies_and_resumes_db,
 )
+from scoring import Scorer
 import logging
 
-app = FastAPI()
+job_runner = JobRunner()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await asyncio.to_thread(init_db)
+    await http_clients.start()
+    yield
+    job_runner.shutdown()
+    await http_clients.close()
+    await AsyncEngineSql.dispose()
+
+
+app = FastAPI(lifespan=lifespan)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -30,6 +53,7 @@ logger = logging.getLogger(__name__)
     "/get_by_api_hh_a_list_of_vacancies",
     tags=["API hh.ru"],
     summary="Получить по API hh.ru список вакансий.",
+    status_code=202,
     description=f"""
     Получить по API hh.ru список вакансий.
 
@@ -44,10 +68,14 @@ logger = logging.getLogger(__name__)
     CURRENCY = {CURRENCY}
     SCHEDULE = {SCHEDULE}
     TARGET_TEXT_SEARCH = {TARGET_TEXT_SEARCH}
+
+    Загрузка выполняется в фоне, статус задачи - `/jobs/{{job_id}}`.
     """,
 )
-def api_get_by_api_hh_a_list_of_vacancies():
-    get_list_vacancies_from_hh_api(
+def api_get_by_api_hh_a_list_of_vacancies() -> Job:
+    job, _ = job_runner.submit(
+        "list_vacancies",
+        get_list_vacancies_from_hh_api,
         SALARY,
         TARGET_TEXT_SEARCH,
         {
@@ -56,22 +84,42 @@ def api_get_by_api_hh_a_list_of_vacancies():
             **({"currency": CURRENCY} if CURRENCY else {}),
         },
     )
-    return {"message": "OK"}
+    return job
 
 
 @app.post(
     "/get_by_api_hh_the_text_of_the_vacancy",
     tags=["API hh.ru"],
     summary="Получить по API hh.ru текст вакансий",
+    status_code=202,
 )
-def api_get_by_api_hh_the_text_of_the_vacancy():
+def api_get_by_api_hh_the_text_of_the_vacancy() -> Job:
     """
-    Получить по API hh.ru текст вакансий.
+    Получить по API hh.ru текст вакансий и токенизировать их.
+
+    Загрузка выполняется в фоне, статус задачи - `/jobs/{job_id}`.
+    Если задача уже выполняется, то возвращается она.
     """
-    get_job_text_from_hh_api()
-    converting_vacancies_by_db()
-    tokenize_vacancies_and_resumes_db()
-    return {"message": "OK"}
+
+    def load_and_tokenize(progress: Progress):
+        get_job_text_from_hh_api(progress=progress)
+        tokenize_vacancies_and_resumes_db(progress=progress)
+
+    job, _ = job_runner.submit("vacancies_text", load_and_tokenize)
+    return job
+
+
+@app.get("/jobs", tags=["Задачи"], summary="Последние фоновые задачи")
+def api_jobs() -> list[Job]:
+    return job_runner.jobs()
+
+
+@app.get("/jobs/{job_id}", tags=["Задачи"], summary="Статус фоновой задачи")
+def api_job(job_id: str) -> Job:
+    job = job_runner.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 
 @app.get(
@@ -79,15 +127,31 @@ def api_get_by_api_hh_the_text_of_the_vacancy():
     tags=["Анализ данных"],
     summary="Поиск вакансий которые подходят под мое резюме",
 )
-def api_search_db_for_jobs_that_fit_my_resume(
+async def api_search_db_for_jobs_that_fit_my_resume(
     limit: int = Query(
         default=30, description="Ограничить количество записей в ответе"
     ),
+    scorer: Scorer = Query(
+        default="overlap",
+        description="""Способ оценки совпадения резюме и вакансии:
+
+        - Доля токенов вакансии, которые есть в резюме (scorer=overlap)
+        - Косинусная близость TF-IDF векторов (scorer=tfidf)
+        - Оценка BM25 вакансии по токенам резюме (scorer=bm25)
+        """,
+    ),
+    offset: int = Query(default=0, ge=0, description="Пропустить записей с начала"),
+    include_text: bool = Query(default=True, description="Включить текст вакансии"),
+    include_tokens: bool = Query(
+        default=True, description="Включить токены вакансии и совпадения с резюме"
+    ),
 ) -> list[ResponseSearch]:
     """
     Поиск вакансий которые подходят под мое резюме
     """
-    return search_db_for_jobs_that_fit_my_resume(limit)
+    return await search_db_for_jobs_that_fit_my_resume_async(
+        limit, scorer, offset, include_text, include_tokens
+    )
 
 
 @app.get(
@@ -95,29 +159,52 @@ def api_search_db_for_jobs_that_fit_my_resume(
     tags=["Анализ данных"],
     summary="Узнать статистику частых скилов",
 )
-def api_find_out_the_statistics_of_frequent_skills(
-    lang: str = Query(
+async def api_find_out_the_statistics_of_frequent_skills(
+    lang: Lang = Query(
         default="all",
-        enum=["eng", "all"],
         description="Язык слов.",
     ),
-    type_token: str = Query(
+    type_token: TypeToken = Query(
         default="missing_token",
-        enum=["missing_token", "common_tokens"],
         description="""В каких токенах искать:
 
         - Которых у меня нет в резюме (type_token=missing_token)
         - Которые у меня есть в резюме (type_token=common_tokens)
         """,
     ),
+    limit: int = Query(default=200, ge=1, description="Количество скилов"),
 ) -> ResponseFrequentSkills:
     """Узнать статистику частых скилов в вакансиях"""
-    return find_out_the_statistics_of_frequent_skills(
+    return await find_out_the_statistics_of_frequent_skills_async(
         lang,
         type_token,
+        limit,
     )
 
 
+@app.get(
+    "/search_vacancies_by_tokens",
+    tags=["Анализ данных"],
+    summary="Поиск вакансий по слову или словосочетанию",
+)
+async def api_search_vacancies_by_tokens(
+    q: str = Query(description="Слово или словосочетание"),
+    tokenize: bool = Query(
+        default=True,
+        description="""Как понимать `q`:
+
+        - Обычный текст, который нужно токенизировать (tokenize=true)
+        - Уже готовые токены через пробел (tokenize=false)
+        """,
+    ),
+    limit: int = Query(
+        default=100, description="Ограничить количество записей в ответе"
+    ),
+) -> list[ResponseTokenSearch]:
+    """Поиск вакансий по слову или словосочетанию через индекс токенов"""
+    return await search_vacancies_by_tokens_async(q, tokenize, limit)
+
+
 # Подключить статические файлы
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
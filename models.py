@@ -1,29 +1,71 @@
+import ast
+import json
+import logging
+import sqlite3
+from array import array
+from typing import Callable, Iterable
+
 from sqlalchemy import (
     Boolean,
     Column,
     DateTime,
     Float,
+    ForeignKey,
+    Index,
     Integer,
+    LargeBinary,
     String,
     Text,
     create_engine,
+    event,
+    func,
+    inspect,
+    select,
+    text,
 )
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from settings_app import (
+    db_batch_size,
+    db_busy_timeout,
+    db_cache_size,
+    db_max_overflow,
+    db_mmap_size,
+    db_pool_size,
+    db_synchronous,
+    db_temp_store,
+    vacancies_db_path,
+)
 
-from settings_app import vacancies_db_path
+logger = logging.getLogger(__name__)
 
 Base = declarative_base()
 
 
 class Vacancy(Base):
     __tablename__ = "vacancies"
+    __table_args__ = (
+        # Вакансии, на которые я не откликался (поиск, токенизация)
+        Index("ix_vacancies_send_offer", "send_offer", "id"),
+        Index("ix_vacancies_published_at", "published_at"),
+        Index("ix_vacancies_type_open", "type_open", "published_at"),
+        # Вакансии с самой большой ЗП
+        Index("ix_vacancies_salary", "salary_currency", "salary_from", "salary_to"),
+        Index("ix_vacancies_salary_from", "salary_from"),
+        Index("ix_vacancies_employer_id", "employer_id"),
+    )
 
     id = Column(Integer, primary_key=True)
     experience = Column(String(50))  # Опыт работы
     schedule = Column(String(50))  # График работы
     employment = Column(String(50))  # Тип занятости
     description = Column(Text)  # Описание вакансии
-    key_skills = Column(Text)  # Ключевые навыки (в формате JSON)
+    key_skills = Column(Text)  # Ключевые навыки (в формате JSON), см. VacancySkill
     employer_id = Column(Integer)  # ID работодателя
     employer_name = Column(String(100))  # Имя работодателя
     employer_url = Column(String(200))  # URL работодателя
@@ -42,16 +84,438 @@ class Vacancy(Base):
 
 class TokenizationVacancy(Base):
     __tablename__ = "tokenization"
+    # Количество вакансий с токенами для статистики частых скилов
+    __table_args__ = (
+        Index("ix_tokenization_len_common_tokens", "len_common_tokens"),
+        Index("ix_tokenization_len_missing_tokens", "len_missing_tokens"),
+    )
 
     id = Column(Integer, primary_key=True)
     common_tokens = Column(Text)  # Общие токены
     len_common_tokens = Column(Integer)  # Количество общих токенов
     missing_tokens = Column(Text)  # Отсутствующие токены
     len_missing_tokens = Column(Integer)  # Количество отсутствующих токенов
-    vacancy = Column(Text)  # Вакансия
+    # ID токенов вакансии из `tokens` с учетом порядка, см. `pack_ints`
+    token_ids = Column(LargeBinary)
     score = Column(Float)  # Оценка
+    description_hash = Column(String(64))  # Хеш описания вакансии при токенизации
+    resume_hash = Column(String(64))  # Хеш резюме, для которого посчитана оценка
+    tokenized_at = Column(DateTime)  # Дата токенизации
+
+
+class VacancySkill(Base):
+    """Ключевые навыки вакансии"""
+
+    __tablename__ = "vacancy_skill"
+
+    vacancy_id = Column(Integer, primary_key=True)  # ID вакансии
+    skill = Column(String(200), primary_key=True, index=True)  # Навык
+
+
+class Token(Base):
+    """Словарь токенов"""
+
+    __tablename__ = "tokens"
+
+    id = Column(Integer, primary_key=True)
+    text = Column(String(100), unique=True, nullable=False)  # Токен
+
+
+class VacancyToken(Base):
+    """Инвертированный индекс: токен -> вакансии, в которых он встречается"""
+
+    __tablename__ = "vacancy_token"
+    __table_args__ = (Index("ix_vacancy_token_token", "token_id", "vacancy_id"),)
+
+    vacancy_id = Column(Integer, primary_key=True)  # ID вакансии
+    token_id = Column(Integer, ForeignKey("tokens.id"), primary_key=True)  # ID токена
+    count = Column(Integer)  # Количество вхождений токена в вакансию
+    positions = Column(LargeBinary)  # Позиции токена в токенах вакансии
+
+
+class TokenFrequency(Base):
+    """Количество вакансий, в которых токен есть / отсутствует в резюме"""
+
+    __tablename__ = "token_frequency"
+    __table_args__ = (
+        Index("ix_token_frequency_lang_common", "lang", "common_count"),
+        Index("ix_token_frequency_lang_missing", "lang", "missing_count"),
+        Index("ix_token_frequency_common", "common_count"),
+        Index("ix_token_frequency_missing", "missing_count"),
+    )
+
+    token = Column(String(100), primary_key=True)  # Токен
+    lang = Column(String(10))  # eng - токен начинается с латинской буквы, иначе other
+    common_count = Column(Integer, default=0)  # В скольких вакансиях токен общий
+    missing_count = Column(Integer, default=0)  # В скольких вакансиях токен отсутствует
+
+
+class CrawlState(Base):
+    """Состояние загрузки текста вакансий из API hh.ru"""
+
+    __tablename__ = "crawl_state"
+    # Вакансии, которые ждут загрузки
+    __table_args__ = (Index("ix_crawl_state_status", "status", "attempts"),)
+
+    id = Column(Integer, primary_key=True)  # ID вакансии
+    # pending - ждет загрузки, done - загружена, failed - ошибка загрузки
+    status = Column(String(20))
+    attempts = Column(Integer, default=0)  # Количество неудачных попыток загрузки
+    last_error = Column(Text)  # Последняя ошибка загрузки
+    listed_published_at = Column(DateTime)  # Дата публикации в списке вакансий
+    fetched_at = Column(DateTime)  # Дата загрузки текста вакансии
+
+
+class DataVersion(Base):
+    """
+    Счётчики изменений таблиц, увеличиваются триггерами БД при каждом изменении,
+    в том числе сделанном вручную, см. `CHANGE_TRIGGERS`
+    """
+
+    __tablename__ = "data_version"
+
+    name = Column(String(50), primary_key=True)  # Имя таблицы
+    version = Column(Integer, default=0)  # Количество изменений
+
+
+# Изменения, которые отслеживает `DataVersion`:
+# таблица -> условие для UPDATE (добавление и удаление строк учитываются всегда)
+CHANGE_TRIGGERS: dict[str, str] = {
+    "vacancies": (
+        "OLD.description IS NOT NEW.description "
+        "OR OLD.send_offer IS NOT NEW.send_offer"
+    ),
+    "tokenization": (
+        "OLD.token_ids IS NOT NEW.token_ids "
+        "OR OLD.description_hash IS NOT NEW.description_hash"
+    ),
+}
+
+
+def bulk_upsert(
+    session: Session,
+    model,
+    rows: list[dict],
+    batch_size: int = db_batch_size,
+    on_error: Callable[[dict, Exception], None] | None = None,
+    before_write: Callable[[Session, list[dict]], None] | None = None,
+) -> int:
+    """
+    Вставить или обновить записи `INSERT ... ON CONFLICT DO UPDATE`.
+
+    Записи сохраняются пачками по `batch_size` штук, каждая пачка в своей транзакции.
+    Если пачка не сохранилась, то её записи сохраняются по одной,
+    чтобы одна ошибочная запись не отменяла всю пачку.
+
+    Для каждой записи, которую не удалось сохранить, вызывается `on_error`.
+    `before_write` вызывается перед записью пачки в той же транзакции,
+    например для обновления зависимых таблиц.
+
+    Все записи должны иметь одинаковый набор ключей.
+    Возвращает количество сохранённых записей.
+    """
+    if not rows:
+        return 0
+    primary_keys = [column.name for column in model.__table__.primary_key]
+    stmt = insert(model)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=primary_keys,
+        set_={
+            name: stmt.excluded[name] for name in rows[0] if name not in primary_keys
+        },
+    )
+    saved = 0
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start : start + batch_size]
+        try:
+            if before_write:
+                before_write(session, batch)
+            session.execute(stmt, batch)
+            session.commit()
+            saved += len(batch)
+            continue
+        except SQLAlchemyError as e:
+            session.rollback()
+            logger.warning(
+                f"Batch {model.__tablename__} failed, saving one by one: {e}"
+            )
+        for row in batch:
+            try:
+                if before_write:
+                    before_write(session, [row])
+                session.execute(stmt, [row])
+                session.commit()
+                saved += 1
+            except SQLAlchemyError as e:
+                session.rollback()
+                row_id = {key: row[key] for key in primary_keys}
+                logger.error(
+                    f"Ошибка при сохранении {model.__tablename__} {row_id}: {e}"
+                )
+                if on_error:
+                    on_error(row, e)
+    return saved
+
+
+def pack_ints(values: Iterable[int]) -> bytes:
+    """Компактное представление списка целых чисел (ID токенов, позиций)"""
+    return array("I", values).tobytes()
+
+
+def unpack_ints(data: bytes | None) -> list[int]:
+    """Обратное преобразование `pack_ints`"""
+    values = array("I")
+    if data:
+        values.frombytes(data)
+    return values.tolist()
+
+
+def intern_tokens(
+    conn, tokens: Iterable[str], batch_size: int = db_batch_size
+) -> dict[str, int]:
+    """
+    ID токенов из словаря `tokens`, отсутствующие токены добавляются в словарь.
+
+    `conn` - `Session` или `Connection`, изменения не сохраняются.
+    """
+    tokens = list(set(tokens))
+    ids: dict[str, int] = {}
+    stmt = insert(Token).on_conflict_do_nothing(index_elements=[Token.text])
+    for start in range(0, len(tokens), batch_size):
+        batch = tokens[start : start + batch_size]
+        conn.execute(stmt, [{"text": token} for token in batch])
+        for token, id_ in conn.execute(
+            select(Token.text, Token.id).where(Token.text.in_(batch))
+        ):
+            ids[token] = id_
+    return ids
+
+
+def token_texts(conn) -> dict[int, str]:
+    """Весь словарь токенов: ID -> токен"""
+    return {id_: token for id_, token in conn.execute(select(Token.id, Token.text))}
+
+
+def decode_tokens(data: bytes | None, texts: dict[int, str]) -> list[str]:
+    """Токены вакансии по сохранённым `TokenizationVacancy.token_ids`"""
+    return [texts[id_] for id_ in unpack_ints(data)]
+
+
+def _add_missing_columns(engine):
+    """
+    `create_all` не добавляет новые колонки в уже существующие таблицы,
+    поэтому добавляем их в БД, созданную прошлыми версиями, через `ALTER TABLE`.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    conn.execute(
+                        text(
+                            f"ALTER TABLE {table.name} ADD COLUMN {column.name} "
+                            f"{column.type.compile(engine.dialect)}"
+                        )
+                    )
+
+
+def _create_missing_indexes(engine):
+    """
+    `create_all` не создаёт индексы в уже существующих таблицах,
+    поэтому создаём недостающие индексы из моделей отдельно.
+    """
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+        # Обновить статистику для планировщика запросов, если она устарела
+        conn.execute(text("PRAGMA optimize"))
+
+
+def _parse_stored_tokens(vacancy: str | None) -> list[str] | None:
+    """
+    Токены из старой колонки `tokenization.vacancy`:
+    JSON или `str(list)` (repr Python) в самых старых версиях.
+    """
+    if not vacancy:
+        return None
+    try:
+        return json.loads(vacancy)
+    except ValueError:
+        pass
+    try:
+        return ast.literal_eval(vacancy)
+    except (ValueError, SyntaxError):
+        return None
+
+
+def _migrate_token_storage(engine):
+    """
+    Раньше токены вакансии хранились списком строк в `tokenization.vacancy`.
+    Переводим их в словарь `tokens` и `tokenization.token_ids`
+    (только ещё не переведённые записи), затем удаляем старую колонку.
+    `DROP COLUMN` есть только в SQLite 3.35+, в старых версиях колонка остаётся.
+    Переведённые вакансии сразу добавляются в индекс `vacancy_token`,
+    иначе поиск по токенам не находил бы их до следующей токенизации.
+    """
+    # `token_index` импортирует модели, поэтому импортируем его здесь
+    from token_index import update_token_index
+
+    columns = {column["name"] for column in inspect(engine).get_columns("tokenization")}
+    if "vacancy" not in columns:
+        return
+    with engine.begin() as conn:
+        rows = [
+            (id_, _parse_stored_tokens(vacancy))
+            for id_, vacancy in conn.execute(
+                text(
+                    "SELECT id, vacancy FROM tokenization "
+                    "WHERE token_ids IS NULL AND vacancy IS NOT NULL"
+                )
+            )
+        ]
+        ids = intern_tokens(
+            conn, (token for _, tokens in rows if tokens for token in tokens)
+        )
+        updates = [
+            {
+                "id": id_,
+                "token_ids": pack_ints(ids[token] for token in tokens),
+            }
+            for id_, tokens in rows
+            if tokens is not None
+        ]
+        if updates:
+            conn.execute(
+                text("UPDATE tokenization SET token_ids = :token_ids WHERE id = :id"),
+                updates,
+            )
+            logger.info(f"Migrated stored tokens of {len(updates)} vacancies")
+        if sqlite3.sqlite_version_info >= (3, 35, 0):
+            conn.execute(text("ALTER TABLE tokenization DROP COLUMN vacancy"))
+            logger.info("Dropped column tokenization.vacancy")
+        else:
+            logger.warning(
+                f"SQLite {sqlite3.sqlite_version} can't drop columns, "
+                f"tokenization.vacancy is kept"
+            )
+    job_tokens = {id_: tokens for id_, tokens in rows if tokens is not None}
+    if job_tokens:
+        with Session(engine) as session:
+            update_token_index(session, job_tokens)
+
+
+def _migrate_vacancy_skills(engine):
+    """Заполнить `vacancy_skill` по колонке `vacancies.key_skills`"""
+    with engine.begin() as conn:
+        if conn.scalar(select(func.count()).select_from(VacancySkill)):
+            return
+        rows = [
+            {"vacancy_id": id_, "skill": skill}
+            for id_, key_skills in conn.execute(
+                select(Vacancy.id, Vacancy.key_skills).where(Vacancy.key_skills != "")
+            )
+            for skill in set(json.loads(key_skills))
+        ]
+        if rows:
+            conn.execute(insert(VacancySkill), rows)
+            logger.info(f"Migrated key skills: {len(rows)}")
+
+
+def _fill_token_frequency(engine):
+    """
+    Заполнить пустую `token_frequency` по уже сохранённым результатам токенизации,
+    иначе статистика скилов будет пустой до следующей токенизации.
+    """
+    # `token_frequency` импортирует модели, поэтому импортируем его здесь
+    from token_frequency import is_token_frequency_empty, rebuild_token_frequency
+
+    with Session(engine) as session:
+        if (
+            is_token_frequency_empty(session)
+            and session.scalar(select(TokenizationVacancy.id).limit(1)) is not None
+        ):
+            rebuild_token_frequency(session)
+
+
+def _create_change_triggers(engine):
+    """Триггеры, которые увеличивают счётчики `DataVersion` при изменении таблиц"""
+    with engine.begin() as conn:
+        for table, update_when in CHANGE_TRIGGERS.items():
+            conn.execute(
+                text(
+                    "INSERT OR IGNORE INTO data_version (name, version) "
+                    "VALUES (:name, 0)"
+                ),
+                {"name": table},
+            )
+            bump = (
+                f"UPDATE data_version SET version = version + 1 "
+                f"WHERE name = '{table}';"
+            )
+            for event_name, when in (
+                ("INSERT", ""),
+                ("DELETE", ""),
+                ("UPDATE", f"WHEN {update_when}"),
+            ):
+                conn.execute(
+                    text(
+                        f"CREATE TRIGGER IF NOT EXISTS "
+                        f"tr_{table}_{event_name.lower()}_version "
+                        f"AFTER {event_name} ON {table} {when} "
+                        f"BEGIN {bump} END"
+                    )
+                )
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    WAL позволяет читать БД, пока другое соединение в неё пишет,
+    поэтому запросы API не ждут окончания загрузки вакансий.
+    Остальные настройки действуют только на текущее соединение.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA synchronous={db_synchronous}")
+    cursor.execute(f"PRAGMA cache_size={db_cache_size}")
+    cursor.execute(f"PRAGMA mmap_size={db_mmap_size}")
+    cursor.execute(f"PRAGMA temp_store={db_temp_store}")
+    cursor.close()
+
+
+# Подключение к базе данных, таблицы создаёт `init_db`
+BaseEngineSql = create_engine(
+    f"sqlite:///{vacancies_db_path}",
+    json_serializer=lambda obj: json.dumps(obj, ensure_ascii=False),
+    connect_args={"timeout": db_busy_timeout},
+)
+event.listen(BaseEngineSql, "connect", _set_sqlite_pragmas)
+
+# Асинхронный движок для чтения из API сервера
+AsyncEngineSql = create_async_engine(
+    f"sqlite+aiosqlite:///{vacancies_db_path}",
+    json_serializer=lambda obj: json.dumps(obj, ensure_ascii=False),
+    connect_args={"timeout": db_busy_timeout},
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=db_pool_size,
+    max_overflow=db_max_overflow,
+)
+event.listen(AsyncEngineSql.sync_engine, "connect", _set_sqlite_pragmas)
+AsyncSessionSql = async_sessionmaker(AsyncEngineSql, expire_on_commit=False)
+
 
+def init_db(engine=BaseEngineSql):
+    """
+    Создать таблицы и обновить схему БД, созданной прошлыми версиями.
 
-# Создание базы данных и таблицы
-BaseEngineSql = create_engine(f"sqlite:///{vacancies_db_path}")
-Base.metadata.create_all(BaseEngineSql)
+    Вызывается при запуске API сервера, а не при импорте модуля,
+    чтобы импорт не менял БД. Повторный вызов ничего не меняет.
+    """
+    Base.metadata.create_all(engine)
+    _add_missing_columns(engine)
+    _migrate_token_storage(engine)
+    _migrate_vacancy_skills(engine)
+    _fill_token_frequency(engine)
+    _create_change_triggers(engine)
+    _create_missing_indexes(engine)
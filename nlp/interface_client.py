@@ -1,31 +1,109 @@
 import asyncio
+import json
 import logging
+from functools import cache
 from typing import List
 
 import aiohttp
 
-from settings_app import url_nlp_server
+from http_clients import client_session, run_sync
+from nlp.token_cache import TokenCache
+from settings_app import (
+    nlp_batch_size,
+    token_cache_db_path,
+    token_cache_memory_size,
+    url_nlp_server,
+    url_nlp_server_batch,
+)
 
 logger = logging.getLogger(__name__)
 
 
+@cache
+def get_token_cache() -> TokenCache:
+    """
+    Кеш токенов клиента.
+
+    Создается при первом обращении, а не при импорте модуля,
+    т.к. открывает базу на диске и чистит в ней старые записи.
+    """
+    return TokenCache(token_cache_db_path, max_size=token_cache_memory_size)
+
+
 def client_api_text_to_tokens(text: str) -> List[str]:
     async def run():
-        async with aiohttp.ClientSession() as session:
+        async with client_session("nlp") as session:
             return await client_api_text_to_tokens_async(text, session)
 
-    return asyncio.run(run())
+    return run_sync(run)
 
 
 async def client_api_text_to_tokens_async(
     text: str, session: aiohttp.ClientSession
 ) -> List[str]:
+    # Запросы к SQLite и хеширование текста выполняются вне цикла событий
+    token_cache = await asyncio.to_thread(get_token_cache)
+    if (tokens := await asyncio.to_thread(token_cache.get, text)) is not None:
+        return tokens
     payload = {"text": text}
     async with session.post(url_nlp_server, json=payload) as response:
         if response.status == 200:
             result = await response.json()
+            await asyncio.to_thread(token_cache.set, text, result["tokens"])
             return result["tokens"]
         else:
             logger.error(f"Ошибка: {response.status}")
             logger.error(await response.text())
             raise ValueError
+
+
+async def client_api_texts_to_tokens_async(
+    texts: dict[int, str],
+    session: aiohttp.ClientSession,
+    batch_size: int = nlp_batch_size,
+) -> dict[int, List[str]]:
+    """
+    Пакетная токенизация текстов.
+
+    Тексты, которых нет в кеше токенов, отправляются на NLP сервер
+    пачками по `batch_size` штук, ответ сервера читается построчно (NDJSON).
+    Если в ответе нет токенов какого-то текста (ответ оборвался), то `ValueError`.
+    """
+    token_cache = await asyncio.to_thread(get_token_cache)
+    result, texts_missing = await asyncio.to_thread(token_cache.get_many, texts)
+    logger.info(f"Token cache: {len(result)} hits, {len(texts_missing)} misses")
+    items = list(texts_missing.items())
+    for start in range(0, len(items), batch_size):
+        batch = dict(items[start : start + batch_size])
+        batch_tokens: dict[int, List[str]] = {}
+        payload = [{"id": id_, "text": text} for id_, text in batch.items()]
+        async with session.post(url_nlp_server_batch, json=payload) as response:
+            if response.status != 200:
+                logger.error(f"Ошибка: {response.status}")
+                logger.error(await response.text())
+                raise ValueError
+            # Строки с токенами могут быть длиннее лимита `readline`,
+            # поэтому собираем их из кусков вручную.
+            buffer = b""
+            async for chunk in response.content.iter_any():
+                buffer += chunk
+                *lines, buffer = buffer.split(b"\n")
+                for line in lines:
+                    if line.strip():
+                        row = json.loads(line)
+                        batch_tokens[row["id"]] = row["tokens"]
+            if buffer.strip():
+                row = json.loads(buffer)
+                batch_tokens[row["id"]] = row["tokens"]
+        # Если ответ сервера оборвался, то полученные токены всё равно сохраняем в кеш
+        received = {id_: text for id_, text in batch.items() if id_ in batch_tokens}
+        await asyncio.to_thread(token_cache.set_many, received, batch_tokens)
+        if len(received) < len(batch):
+            missing = sorted(batch.keys() - received.keys())
+            raise ValueError(
+                f"NLP server returned no tokens for {len(missing)} of {len(batch)} "
+                f"texts, ids: {missing[:10]}"
+            )
+        result.update(batch_tokens)
+        logger.info(f"Tokenized {start + len(batch)} of {len(items)}")
+    return result
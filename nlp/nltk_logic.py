@@ -1,20 +1,39 @@
 import re
+from functools import lru_cache
 
 import nltk
 from nltk.stem import SnowballStemmer
 from nltk.tokenize import word_tokenize
 
+_NOT_WORD_RE = re.compile(r"[^a-zA-Zа-яА-ЯёЁ0-9]")
+_SPACES_RE = re.compile(r"\s+")
+
+# Символы, по первому из которых определяется язык токена
+_RUSSIAN_CHARS = frozenset(
+    [chr(c) for c in range(ord("а"), ord("я") + 1)]
+    + [chr(c) for c in range(ord("А"), ord("Я") + 1)]
+    + ["ё", "Ё"]
+)
+_ENGLISH_CHARS = frozenset(
+    [chr(c) for c in range(ord("a"), ord("z") + 1)]
+    + [chr(c) for c in range(ord("A"), ord("Z") + 1)]
+)
+
 
 class CustomNltk:
     """Кастомный нлп"""
 
-    def __init__(self):
-        nltk.download("punkt")
+    def __init__(self, download: bool = True, stem_cache_size: int = 100_000):
+        if download:
+            nltk.download("punkt")
 
         # Инициализация стеммеров
         self.russian_stemmer = SnowballStemmer("russian")
         self.english_stemmer = SnowballStemmer("english")
 
+        # Кеш стемминга слово -> основа, словарь вакансий сильно повторяется
+        self._stem = lru_cache(maxsize=stem_cache_size)(self._stem_token)
+
     def text_to_tokens(self, text: str) -> list[str]:
         """
         Токенизация текста
@@ -28,30 +47,22 @@ class CustomNltk:
         В отличие от лемматизации, стемминг не обязательно возвращает слово к его правильной лексической форме,
         а просто отсекает окончания.
         """
-        stemmed_tokens = []
-        for token in tokens:
-            # Проверка, является ли токен числом
-            if re.match(r"^\d+$", token):
-                stemmed_tokens.append(token)  # Возвращаем число без изменений
-            # Проверка языка
-            elif re.match(r"[а-яА-ЯёЁ]", token):
-                stemmed_tokens.append(
-                    self.russian_stemmer.stem(token)
-                )  # Стемминг для русского
-            elif re.match(r"[a-zA-Z]", token):
-                stemmed_tokens.append(
-                    self.english_stemmer.stem(token)
-                )  # Стемминг для английского
-            else:
-                stemmed_tokens.append(
-                    token
-                )  # Возвращаем токен без изменений, если язык не распознан
-        return stemmed_tokens
+        return [self._stem(token) for token in tokens]
+
+    def _stem_token(self, token: str) -> str:
+        """Стемминг одного токена, язык определяется по первому символу"""
+        first_char = token[:1]
+        if first_char in _RUSSIAN_CHARS:
+            return self.russian_stemmer.stem(token)  # Стемминг для русского
+        elif first_char in _ENGLISH_CHARS:
+            return self.english_stemmer.stem(token)  # Стемминг для английского
+        # Числа и токены, язык которых не распознан, возвращаем без изменений
+        return token
 
     @staticmethod
     def _clean_text(text):
         # Используем регулярное выражение для удаления всего, кроме букв и цифр
-        cleaned_text = re.sub(r"[^a-zA-Zа-яА-ЯёЁ0-9]", " ", text)
+        cleaned_text = _NOT_WORD_RE.sub(" ", text)
         # Удаляем лишние пробелы
-        cleaned_text = re.sub(r"\s+", " ", cleaned_text).strip()
+        cleaned_text = _SPACES_RE.sub(" ", cleaned_text).strip()
         return cleaned_text
@@ -2,28 +2,185 @@
 python -m nlp.server
 """
 
-from fastapi import FastAPI
+import asyncio
+import json
+import math
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+
+import nltk
+from fastapi import FastAPI, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
 from nlp.nltk_logic import CustomNltk
+from nlp.token_cache import TokenCache
+from settings_app import (
+    nlp_process_workers,
+    nlp_token_cache_db_path,
+    token_cache_memory_size,
+)
+
+# Экземпляр `CustomNltk` внутри процесса пула, создается один раз при старте процесса
+_process_nltk: CustomNltk | None = None
+
+
+def _init_process():
+    global _process_nltk
+    _process_nltk = CustomNltk(download=False)
+
+
+def _texts_to_tokens(texts: list[str]) -> list[list[str]]:
+    """Токенизация пачки текстов внутри процесса пула"""
+    return [_process_nltk.text_to_tokens(text) for text in texts]
+
+
+class ProcessPoolStats:
+    """Статистика работы пула процессов токенизации"""
+
+    def __init__(self):
+        # Количество пачек, отправленных в пул и еще не обработанных
+        self.queue_depth = 0
+        self.requests = 0
+        self.texts = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+
+    async def run(self, pool: ProcessPoolExecutor, texts: list[str]):
+        """Выполнить токенизацию пачки текстов в пуле процессов"""
+        self.queue_depth += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                pool, _texts_to_tokens, texts
+            )
+        finally:
+            self.queue_depth -= 1
+
+    def add_request(self, count_texts: int, latency: float):
+        self.requests += 1
+        self.texts += count_texts
+        self.latency_sum += latency
+        self.latency_max = max(self.latency_max, latency)
+
+    def as_dict(self) -> dict:
+        return {
+            "workers": nlp_process_workers,
+            "queue_depth": self.queue_depth,
+            "requests": self.requests,
+            "texts": self.texts,
+            "latency_avg_ms": round(
+                self.latency_sum / self.requests * 1000 if self.requests else 0, 2
+            ),
+            "latency_max_ms": round(self.latency_max * 1000, 2),
+            "cache": token_cache.stats(),
+        }
+
 
-nltk_app = FastAPI()
+stats = ProcessPoolStats()
+token_cache = TokenCache(nlp_token_cache_db_path, max_size=token_cache_memory_size)
+pool: ProcessPoolExecutor | None = None
 
 
-nltk_processor = CustomNltk()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global pool
+    # Загружаем модели один раз, до запуска процессов пула
+    nltk.download("punkt")
+    pool = ProcessPoolExecutor(
+        max_workers=nlp_process_workers, initializer=_init_process
+    )
+    yield
+    pool.shutdown(cancel_futures=True)
+
+
+nltk_app = FastAPI(lifespan=lifespan)
 
 
 class TextInput(BaseModel):
     text: str
 
 
+class TextItemInput(BaseModel):
+    id: int
+    text: str
+
+
 @nltk_app.post("/text_to_tokens")
-async def text_to_tokens(input_data: TextInput):
-    tokens = nltk_processor.text_to_tokens(input_data.text)
+async def text_to_tokens(input_data: TextInput, response: Response):
+    start = time.perf_counter()
+    # Запросы к SQLite и хеширование текстов выполняются вне цикла событий
+    if (tokens := await asyncio.to_thread(token_cache.get, input_data.text)) is None:
+        (tokens,) = await stats.run(pool, [input_data.text])
+        await asyncio.to_thread(token_cache.set, input_data.text, tokens)
+    latency = time.perf_counter() - start
+    stats.add_request(1, latency)
+    response.headers["X-Latency-Ms"] = f"{latency * 1000:.2f}"
     return {"tokens": tokens}
 
 
+@nltk_app.post("/texts_to_tokens")
+async def texts_to_tokens(input_data: list[TextItemInput]):
+    """
+    Пакетная токенизация текстов.
+
+    Ответ в формате NDJSON: по одной строке `{"id": ..., "tokens": [...]}`
+    на каждый текст, в том же порядке, что и во входном списке.
+    Тексты, которых нет в кеше токенов, делятся на части
+    и обрабатываются параллельно в пуле процессов.
+    """
+    start = time.perf_counter()
+    # Ключ - позиция текста во входном списке, т.к. `id` может повторяться
+    cached, missing = await asyncio.to_thread(
+        token_cache.get_many, {i: item.text for i, item in enumerate(input_data)}
+    )
+    missing_positions = list(missing)
+    chunk_size = max(1, math.ceil(len(missing_positions) / (nlp_process_workers * 4)))
+    chunks = [
+        missing_positions[i : i + chunk_size]
+        for i in range(0, len(missing_positions), chunk_size)
+    ]
+    tasks = {
+        chunk[0]: (
+            chunk,
+            asyncio.ensure_future(stats.run(pool, [missing[i] for i in chunk])),
+        )
+        for chunk in chunks
+    }
+
+    async def generate():
+        try:
+            for position, item in enumerate(input_data):
+                if position in tasks:
+                    # Дожидаемся пачку, которая начинается с этой позиции
+                    chunk, task = tasks[position]
+                    chunk_tokens = dict(zip(chunk, await task))
+                    await asyncio.to_thread(
+                        token_cache.set_many,
+                        {i: missing[i] for i in chunk},
+                        chunk_tokens,
+                    )
+                    cached.update(chunk_tokens)
+                yield json.dumps(
+                    {"id": item.id, "tokens": cached[position]}, ensure_ascii=False
+                )
+                yield "\n"
+        finally:
+            for _, task in tasks.values():
+                task.cancel()
+            stats.add_request(len(input_data), time.perf_counter() - start)
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+@nltk_app.get("/stats")
+async def get_stats():
+    """Размер очереди пула процессов и задержка обработки запросов"""
+    return stats.as_dict()
+
+
 if __name__ == "__main__":
     import uvicorn
 
-    uvicorn.run("nlp.server:nltk_app", host="0.0.0.0", port=8932, workers=2)
+    # Масштабирование по ядрам выполняется пулом процессов (nlp_process_workers)
+    uvicorn.run("nlp.server:nltk_app", host="0.0.0.0", port=8932)
@@ -0,0 +1,128 @@
+"""
+Кеш токенов по хешу текста.
+
+LRU кеш в памяти поверх SQLite на диске.
+Ключ - хеш текста вместе с версией токенизатора,
+поэтому при изменении токенизатора старые записи просто перестают находиться,
+а при открытии кеша удаляются.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Final, TypeVar
+
+# Версия логики `CustomNltk`. Увеличьте её при любом изменении токенизации.
+TOKENIZER_VERSION: Final[str] = "1"
+
+K = TypeVar("K")
+
+
+class TokenCache:
+    """Кеш токенов: LRU в памяти + SQLite на диске"""
+
+    def __init__(
+        self,
+        path: Path,
+        max_size: int = 10_000,
+        version: str = TOKENIZER_VERSION,
+    ):
+        self.max_size = max_size
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self._memory: OrderedDict[str, list[str]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS tokens "
+                "(key TEXT PRIMARY KEY, version TEXT, tokens TEXT)"
+            )
+            # Удаляем записи от прошлых версий токенизатора
+            self._conn.execute("DELETE FROM tokens WHERE version != ?", (version,))
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.version}\0{text}".encode()).hexdigest()
+
+    def get_many(self, texts: dict[K, str]) -> tuple[dict[K, list[str]], dict[K, str]]:
+        """
+        Найти токены текстов в кеше.
+
+        Возвращает найденные токены и тексты, которых в кеше нет.
+        """
+        found: dict[K, list[str]] = {}
+        missing: dict[K, str] = {}
+        with self._lock:
+            keys = {id_: self.key(text) for id_, text in texts.items()}
+            # Сначала ищем в памяти
+            not_in_memory: dict[str, list[K]] = {}
+            for id_, key in keys.items():
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[id_] = self._memory[key]
+                else:
+                    not_in_memory.setdefault(key, []).append(id_)
+            # Затем на диске
+            from_disk = self._select(list(not_in_memory))
+            for key, ids in not_in_memory.items():
+                if key in from_disk:
+                    self._remember(key, from_disk[key])
+                    for id_ in ids:
+                        found[id_] = from_disk[key]
+                else:
+                    for id_ in ids:
+                        missing[id_] = texts[id_]
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, missing
+
+    def set_many(self, texts: dict[K, str], tokens: dict[K, list[str]]):
+        """Сохранить токены текстов в кеш"""
+        with self._lock:
+            rows = []
+            for id_, text in texts.items():
+                key = self.key(text)
+                self._remember(key, tokens[id_])
+                rows.append((key, self.version, json.dumps(tokens[id_])))
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO tokens (key, version, tokens) VALUES (?, ?, ?)",
+                    rows,
+                )
+
+    def get(self, text: str) -> list[str] | None:
+        found, _ = self.get_many({0: text})
+        return found.get(0)
+
+    def set(self, text: str, tokens: list[str]):
+        self.set_many({0: text}, {0: tokens})
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "memory_size": len(self._memory),
+        }
+
+    def _remember(self, key: str, tokens: list[str]):
+        self._memory[key] = tokens
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def _select(self, keys: list[str]) -> dict[str, list[str]]:
+        result = {}
+        # Ограничение SQLite на количество параметров в запросе
+        for start in range(0, len(keys), 500):
+            chunk = keys[start : start + 500]
+            rows = self._conn.execute(
+                f"SELECT key, tokens FROM tokens WHERE key IN ({','.join('?' * len(chunk))})",
+                chunk,
+            )
+            result.update({key: json.loads(tokens) for key, tokens in rows})
+        return result
@@ -0,0 +1,80 @@
+"""
+Поиск словосочетаний из токенов (автомат Ахо-Корасик по токенам).
+
+Автомат строится один раз из всех словосочетаний,
+после чего все словосочетания ищутся за один проход по списку токенов.
+Сравнение идет по целым токенам, поэтому `от` не совпадет с частью токена `отдел`.
+"""
+
+from collections import deque
+from typing import Iterable
+
+from my_preferences import PreferencePoints
+
+
+class PhraseMatcher:
+    """Поиск словосочетаний из токенов за один проход"""
+
+    def __init__(self, phrases: Iterable[tuple[list[str], float]]):
+        """
+        :param phrases: Словосочетания (список токенов) и их оценки
+        """
+        self.scores: list[float] = []
+        # Переходы по токенам из каждого состояния
+        self._goto: list[dict[str, int]] = [{}]
+        # Переход при несовпадении
+        self._fail: list[int] = [0]
+        # Номера словосочетаний, которые заканчиваются в состоянии
+        self._output: list[list[int]] = [[]]
+
+        for phrase, score in phrases:
+            if not phrase:
+                continue
+            state = 0
+            for token in phrase:
+                if token not in self._goto[state]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                    self._goto[state][token] = len(self._goto) - 1
+                state = self._goto[state][token]
+            self._output[state].append(len(self.scores))
+            self.scores.append(float(score))
+        self._build_fail()
+
+    @classmethod
+    def from_preferences(cls) -> "PhraseMatcher":
+        """Автомат из предпочтений по словосочетаниям `PreferencePoints.SCORE_LIKE_PHRASE`"""
+        return cls(
+            (phrase, phrases.score)
+            for phrases in PreferencePoints.SCORE_LIKE_PHRASE
+            for phrase in phrases.phrase
+        )
+
+    def _build_fail(self):
+        """Переходы при несовпадении, обход в ширину"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for token, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and token not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(token, 0)
+                self._output[next_state].extend(self._output[self._fail[next_state]])
+
+    def find(self, tokens: Iterable[str]) -> set[int]:
+        """Номера словосочетаний, которые встречаются в токенах"""
+        found: set[int] = set()
+        state = 0
+        for token in tokens:
+            while state and token not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(token, 0)
+            found.update(self._output[state])
+        return found
+
+    def score(self, tokens: Iterable[str]) -> float:
+        """Сумма оценок словосочетаний, которые встречаются в токенах (каждое один раз)"""
+        return sum(self.scores[i] for i in self.find(tokens))
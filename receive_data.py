@@ -1,27 +1,59 @@
 import asyncio
 import json
 import logging
+import math
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 from datetime import datetime
-from sqlite3 import IntegrityError
+from pathlib import Path
 from typing import Any
 
-from markdownify import markdownify as md
-from sqlalchemy.exc import NoResultFound
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import and_, bindparam, delete, insert, or_, update
+from sqlalchemy.orm import Session, sessionmaker
 
-from models import BaseEngineSql, TokenizationVacancy, Vacancy
+from http_clients import run_sync
+from jobs import Progress
+from models import (
+    BaseEngineSql,
+    CrawlState,
+    TokenizationVacancy,
+    Vacancy,
+    VacancySkill,
+    bulk_upsert,
+    decode_tokens,
+    intern_tokens,
+    pack_ints,
+    token_texts,
+)
 from requests_to_external_services import ApiHH
 from settings_app import (
-    vacancies_error_json_path,
+    convert_chunk_size,
+    convert_pool_min_vacancies,
+    convert_process_workers,
+    crawl_max_attempts,
+    db_batch_size,
+    db_in_chunk_size,
+    save_vacancies_text_ndjson,
     vacancies_json_path,
-    vacancies_text_json_path,
+    vacancies_text_ndjson_path,
+)
+from token_frequency import (
+    is_token_frequency_empty,
+    rebuild_token_frequency,
+    update_token_frequency,
 )
-from utils import TokenizationResumeAndVacancies, utc_to_local
+from token_index import indexed_vacancy_ids, update_token_index
+from utils import TokenizationResumeAndVacancies, text_hash
+from vacancy_convert import convert_vacancies, utc_to_local
 
 logger = logging.getLogger(__name__)
 
 
-def get_list_vacancies_from_hh_api(salary, text, params_add, per_page=100):
+def get_list_vacancies_from_hh_api(
+    salary, text, params_add, per_page=100, progress: Progress | None = None
+):
     """Получить список вакансий по указанному фильтру из API hh.ru
 
     params:
@@ -30,216 +62,547 @@ def get_list_vacancies_from_hh_api(salary, text, params_add, per_page=100):
         - "schedule": "remote",  # Удаленная работа
     """
 
-    response: list[dict[str, Any]] = []
-    init_vacancies = ApiHH.get_vacancies(salary, text, params_add, per_page, page=0)
-    response.extend(init_vacancies["items"])
-    for page in range(1, init_vacancies["pages"]):
-        logger.info(f"Page {page} of {init_vacancies['pages']}")
-        vacancies = ApiHH.get_vacancies(salary, text, params_add, per_page, page)
-        response.extend(vacancies["items"])
-
-    # *Запись в файл
+    start = time.perf_counter()
+    if progress:
+        progress("list", 0)
+    response: list[dict[str, Any]] = run_sync(
+        lambda: ApiHH.FetchVacanciesList().fetch_vacancies(
+            salary, text, params_add, per_page
+        )
+    )
+    logger.info(f"Vacancies: {len(response)} in {time.perf_counter() - start:.2f} s")
+
+    # *Запись в файл
     vacancies_json_path.write_text(json.dumps(response, ensure_ascii=False, indent=2))
+    if progress:
+        progress("crawl_state", 0, len(response))
+    update_crawl_state_from_list(response)
+    if progress:
+        progress("crawl_state", len(response), len(response))
     logger.info("Success!: parse_list")
 
 
-def get_job_text_from_hh_api():
-    """Получить текст вакансии из API hh.ru"""
-    vacancies_obj = None
-    # *Если есть ошибки с загруженными вакансиями, то первым делом загрузим вакансии с ошибкой.
-    if vacancies_error_json_path.exists():
-        vacancies_obj = json.loads(vacancies_error_json_path.read_text())
-        logger.info(f"loading error vacancies: {len(vacancies_obj)}")
-    else:
-        vacancies_obj = json.loads(vacancies_json_path.read_text())
-        logger.info(f"loading vacancies: {len(vacancies_obj)}")
+def parse_published_at(vacancy: dict[str, Any]) -> datetime | None:
+    """Дата публикации вакансии из ответа API hh.ru"""
+    if not vacancy.get("published_at"):
+        return None
+    return datetime.fromisoformat(utc_to_local(vacancy["published_at"]))
+
 
-    # *Если такая вакансия уже есть в БД, то пропускаем такие вакансии.
-    vacancies_obj_new = []
+def load_by_ids(
+    columns: list, id_column, ids: list[int], chunk_size: int = db_in_chunk_size
+) -> dict[int, Any]:
+    """
+    Значение колонки `columns[1]` по id для записей, которые уже есть в БД.
+
+    Запросы `IN (...)` делаются частями по `chunk_size` id,
+    из-за ограничения SQLite на количество параметров в запросе.
+    """
+    result: dict[int, Any] = {}
     Session = sessionmaker(bind=BaseEngineSql)
     with Session() as session:
-        for vacancy in vacancies_obj:
-            if not session.query(Vacancy).filter_by(id=vacancy["id"]).first():
-                vacancies_obj_new.append(vacancy)
-    vacancies_obj = vacancies_obj_new
-    if not vacancies_obj:
-        return True
+        for start in range(0, len(ids), chunk_size):
+            result.update(
+                session.query(*columns).filter(
+                    id_column.in_(ids[start : start + chunk_size])
+                )
+            )
+    return result
 
-    fv = ApiHH.FetchVacancies()
-    response = asyncio.run(fv.fetch_vacancies(vacancies_obj))
 
-    # *Запись в файл
-    vacancies_text_json_path.write_text(
-        json.dumps(response, ensure_ascii=False, indent=2)
+def update_crawl_state_from_list(vacancies_obj: list[dict[str, Any]]):
+    """
+    Добавить вакансии из списка вакансий в состояние загрузки.
+
+    Новые вакансии и вакансии, дата публикации которых изменилась, ждут загрузки.
+    Вакансии, которые уже есть в БД с той же датой публикации, считаются загруженными.
+    Состояние остальных вакансий (в том числе с ошибками загрузки) не меняется.
+    """
+    vacancies = {int(vacancy["id"]): vacancy for vacancy in vacancies_obj}
+    stored_published_at = load_vacancies_published_at(list(vacancies))
+    crawl_published_at = load_by_ids(
+        [CrawlState.id, CrawlState.listed_published_at],
+        CrawlState.id,
+        list(vacancies),
+    )
+
+    rows: list[dict[str, Any]] = []
+    for id_, vacancy in vacancies.items():
+        published_at = parse_published_at(vacancy)
+        if id_ in crawl_published_at:
+            if crawl_published_at[id_] == published_at:
+                continue
+            status = "pending"
+        elif is_vacancy_unchanged(vacancy, stored_published_at):
+            status = "done"
+        else:
+            status = "pending"
+        rows.append(
+            {
+                "id": id_,
+                "status": status,
+                "attempts": 0,
+                "last_error": None,
+                "listed_published_at": published_at,
+                "fetched_at": None,
+            }
+        )
+
+    Session = sessionmaker(bind=BaseEngineSql)
+    with Session() as session:
+        bulk_upsert(session, CrawlState, rows)
+    logger.info(
+        f"Crawl state: {sum(row['status'] == 'pending' for row in rows)} "
+        f"vacancies added to download"
     )
-    if fv.error_list:
-        # Сохраняем ошибки в файл, чтобы потом по ним попробовать снова
-        vacancies_error_json_path.write_text(
-            json.dumps(fv.error_list, ensure_ascii=False, indent=2)
+
+
+def save_crawl_state(session: Session, done_ids: list[int], errors: dict[int, str]):
+    """Отметить вакансии загруженными или с ошибкой загрузки"""
+    now = datetime.now()
+    for start in range(0, len(done_ids), db_in_chunk_size):
+        session.execute(
+            update(CrawlState)
+            .where(CrawlState.id.in_(done_ids[start : start + db_in_chunk_size]))
+            .values(status="done", last_error=None, fetched_at=now)
+        )
+    if errors:
+        table = CrawlState.__table__
+        session.execute(
+            update(table)
+            .where(table.c.id == bindparam("b_id"))
+            .values(
+                status="failed",
+                attempts=table.c.attempts + 1,
+                last_error=bindparam("b_error"),
+            ),
+            [{"b_id": id_, "b_error": error} for id_, error in errors.items()],
+        )
+    session.commit()
+
+
+def load_vacancies_published_at(ids: list[int]) -> dict[int, datetime | None]:
+    """Дата публикации вакансий, которые уже есть в БД"""
+    return load_by_ids([Vacancy.id, Vacancy.published_at], Vacancy.id, ids)
+
+
+def is_vacancy_unchanged(
+    vacancy: dict[str, Any], stored_published_at: dict[int, datetime | None]
+) -> bool:
+    """
+    Вакансия уже есть в БД, и её дата публикации в списке вакансий не изменилась.
+
+    Если в списке нет даты публикации, то достаточно наличия вакансии в БД.
+    """
+    id_ = int(vacancy["id"])
+    if id_ not in stored_published_at:
+        return False
+    if not vacancy.get("published_at"):
+        return True
+    return parse_published_at(vacancy) == stored_published_at[id_]
+
+
+def crawl_pending_ids(session: Session, max_attempts: int) -> list[int]:
+    """ID вакансий, которые ждут загрузки или которые можно загрузить снова"""
+    return [
+        id_
+        for (id_,) in session.query(CrawlState.id).filter(
+            or_(
+                CrawlState.status == "pending",
+                and_(
+                    CrawlState.status == "failed",
+                    CrawlState.attempts < max_attempts,
+                ),
+            )
+        )
+    ]
+
+
+def get_job_text_from_hh_api(
+    max_attempts: int = crawl_max_attempts,
+    convert_workers: int = convert_process_workers,
+    progress: Progress | None = None,
+):
+    """Получить текст вакансии из API hh.ru
+
+    Загружаются вакансии, которые ждут загрузки по состоянию загрузки,
+    и вакансии с ошибкой загрузки, у которых меньше `max_attempts` неудачных попыток.
+    Поэтому прерванная загрузка продолжается с того места, где остановилась.
+    Вакансии преобразуются в `convert_workers` процессах.
+    """
+    Session = sessionmaker(bind=BaseEngineSql)
+    with Session() as session:
+        ids = crawl_pending_ids(session, max_attempts)
+    logger.info(f"loading vacancies: {len(ids)}")
+    if not ids:
+        return True
+
+    # Пул создаётся в этом потоке, а не в цикле событий, в котором идёт загрузка
+    with create_convert_pool(convert_workers, len(ids)) as pool:
+        fv = run_sync(
+            lambda: stream_vacancies_to_db(
+                [{"id": id_} for id_ in ids], pool=pool, progress=progress
+            )
+        )
+
+    # Сохраняем ошибки, чтобы потом по ним попробовать снова
+    with Session() as session:
+        save_crawl_state(
+            session, [], {error["id"]: error["error"] for error in fv.error_list}
         )
-    else:
-        # Если не было ошибок, то удалим файл
-        vacancies_error_json_path.unlink(missing_ok=True)
     logger.info("Success!: get_vacancy_text")
     return False if fv.error_list else True
 
 
-def converting_vacancies_by_db():
-    """Преобразуем данные из файлов с вакансиями, в нужный формат для БД"""
+def split_chunks(items: list, chunk_size: int) -> list[list]:
+    return [items[i : i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+
+async def convert_vacancies_async(
+    pool: ProcessPoolExecutor | None,
+    vacancies_text: list[dict[str, Any]],
+    chunk_size: int = convert_chunk_size,
+) -> tuple[list[dict[str, Any]], dict[int, str]]:
+    """Преобразовать вакансии частями по `chunk_size` штук в пуле процессов"""
+    if pool is None:
+        return await asyncio.to_thread(convert_vacancies, vacancies_text)
+    loop = asyncio.get_running_loop()
+    results = await asyncio.gather(
+        *(
+            loop.run_in_executor(pool, convert_vacancies, chunk)
+            for chunk in split_chunks(vacancies_text, chunk_size)
+        )
+    )
+    rows: list[dict[str, Any]] = []
+    errors: dict[int, str] = {}
+    for chunk_rows, chunk_errors in results:
+        rows.extend(chunk_rows)
+        errors.update(chunk_errors)
+    return rows, errors
+
+
+def update_vacancy_skills(session: Session, rows: list[dict[str, Any]]):
+    """Заменить ключевые навыки вакансий `rows` в `vacancy_skill`"""
+    session.execute(
+        delete(VacancySkill).where(
+            VacancySkill.vacancy_id.in_([row["id"] for row in rows])
+        )
+    )
+    skills = [
+        {"vacancy_id": row["id"], "skill": skill}
+        for row in rows
+        if row["key_skills"]
+        for skill in set(json.loads(row["key_skills"]))
+    ]
+    if skills:
+        session.execute(insert(VacancySkill), skills)
+
+
+def save_vacancies_to_db(
+    rows: list[dict[str, Any]],
+    errors: dict[int, str],
+    batch_size: int = db_batch_size,
+) -> int:
+    """
+    Сохранить преобразованные вакансии в БД.
+
+    Ключевые навыки сохраняются в `vacancy_skill` в той же транзакции.
+    Вакансии отмечаются в состоянии загрузки загруженными или с ошибкой.
+    Возвращает количество сохранённых вакансий.
+    """
+    errors = dict(errors)
+
+    def on_error(row: dict[str, Any], error: Exception):
+        errors[row["id"]] = repr(error)
 
     Session = sessionmaker(bind=BaseEngineSql)
     with Session() as session:
-        # Преобразование JSON-данных в словарь Python
-        for data in json.loads(vacancies_text_json_path.read_text()):
-            # Если есть ошибки, то пропускаем итерацию
-            if data.get("errors"):
-                logger.warning(f"Error formatting_vacancies_text: {data.get('errors')}")
-                continue
-            # Извлечение необходимых данных из словаря
-            experience = data.get("experience", {}).get("name", "")
-            schedule = data.get("schedule", {}).get("name", "")
-            employment = data.get("employment", {}).get("name", "")
-            description = data.get("description", "")
-            key_skills = [skill["name"] for skill in data.get("key_skills", [])]
-            employer_id = data.get("employer", {}).get("id", None)
-            employer_name = data.get("employer", {}).get("name", "")
-            employer_url = data.get("employer", {}).get("url", "")
-            published_at = datetime.fromisoformat(
-                utc_to_local(data.get("published_at", ""))
-            )
-            created_at = datetime.fromisoformat(
-                utc_to_local(data.get("created_at", ""))
-            )
-            initial_created_at = datetime.fromisoformat(
-                utc_to_local(data.get("initial_created_at", ""))
-            )
+        bulk_upsert(
+            session,
+            Vacancy,
+            rows,
+            batch_size,
+            on_error=on_error,
+            before_write=update_vacancy_skills,
+        )
+        done_ids = [row["id"] for row in rows if row["id"] not in errors]
+        save_crawl_state(session, done_ids, errors)
+    return len(done_ids)
 
-            salary_from = None
-            salary_to = None
-            salary_currency = None
-            salary_gross = None
 
-            type_open = data.get("type", {}).get("id", "")
+def create_convert_pool(
+    workers: int, count: int, min_vacancies: int = convert_pool_min_vacancies
+) -> ProcessPoolExecutor | nullcontext:
+    """
+    Пул процессов для преобразования `count` вакансий, не больше `workers` процессов.
 
-            if data.get("salary"):
-                salary_from = data.get("salary", {}).get("from", None)
-                salary_to = data.get("salary", {}).get("to", None)
-                salary_currency = data.get("salary", {}).get("currency", None)
-                salary_gross = data.get("salary", {}).get("gross", None)
+    Запуск процесса стоит столько же, сколько преобразование десятков вакансий,
+    поэтому на каждый процесс приходится не меньше `min_vacancies` вакансий,
+    а если хватает только на один процесс (или `workers=0`), то пул не создаётся.
+    Процессы запускаются через `spawn`, а не `fork`, т.к. пул создаётся
+    в многопоточном процессе API сервера.
+    """
+    workers = min(workers, math.ceil(count / min_vacancies))
+    if workers <= 1:
+        return nullcontext()
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
 
-            description_text = md(description)
 
-            # Проверка существования вакансии в базе данных
-            vacancy = session.query(Vacancy).get(data["id"])
+async def stream_vacancies_to_db(
+    vacancies_obj: list[dict[str, Any]],
+    batch_size: int = db_batch_size,
+    ndjson_path: Path | None = (
+        vacancies_text_ndjson_path if save_vacancies_text_ndjson else None
+    ),
+    pool: ProcessPoolExecutor | None = None,
+    progress: Progress | None = None,
+) -> ApiHH.FetchVacancies:
+    """
+    Загрузить текст вакансий из API hh.ru и сразу сохранять их в БД.
 
-            if vacancy:
-                # Обновление существующей записи
-                vacancy.experience = experience
-                vacancy.schedule = schedule
-                vacancy.employment = employment
-                vacancy.description = description_text
-                vacancy.key_skills = (
-                    json.dumps(key_skills, ensure_ascii=False) if key_skills else ""
-                )
-                vacancy.employer_id = employer_id
-                vacancy.employer_name = employer_name
-                vacancy.employer_url = employer_url
-                vacancy.published_at = published_at
-                vacancy.created_at = created_at
-                vacancy.initial_created_at = initial_created_at
-                vacancy.salary_from = salary_from
-                vacancy.salary_to = salary_to
-                vacancy.salary_currency = salary_currency
-                vacancy.salary_gross = salary_gross
-                vacancy.type_open = type_open
-
-            else:
-                # Создание новой записи
-                vacancy = Vacancy(
-                    id=data["id"],
-                    experience=experience,
-                    schedule=schedule,
-                    employment=employment,
-                    description=description_text,
-                    key_skills=(
-                        json.dumps(key_skills, ensure_ascii=False) if key_skills else ""
-                    ),
-                    employer_id=employer_id,
-                    employer_name=employer_name,
-                    employer_url=employer_url,
-                    published_at=published_at,
-                    created_at=created_at,
-                    initial_created_at=initial_created_at,
-                    salary_from=salary_from,
-                    salary_to=salary_to,
-                    salary_currency=salary_currency,
-                    salary_gross=salary_gross,
-                    type_open=type_open,
-                )
-                session.add(vacancy)
+    Загруженные вакансии через очередь попадают в запись в БД пачками по `batch_size` штук.
+    Каждая пачка преобразуется в процессах пула `pool` (без пула - в потоке)
+    и сохраняется в БД одним потоком записи.
+    Если указан `ndjson_path`, то ответы API дописываются в этот файл,
+    для отладки и повторной загрузки через `converting_vacancies_by_db`.
+    """
+    start = time.perf_counter()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=batch_size * 2)
+    saved = 0
+    processed = 0
+    if progress:
+        progress("fetch", 0, len(vacancies_obj))
+
+    async def writer():
+        nonlocal saved, processed
+        batch: list[dict[str, Any]] = []
+        with ndjson_path.open("a") if ndjson_path else nullcontext() as file:
+            while True:
+                data = await queue.get()
+                if data is not None:
+                    if file:
+                        file.write(json.dumps(data, ensure_ascii=False) + "\n")
+                    batch.append(data)
+                if batch and (data is None or len(batch) >= batch_size):
+                    rows, errors = await convert_vacancies_async(pool, batch)
+                    saved += await asyncio.to_thread(
+                        save_vacancies_to_db, rows, errors, batch_size
+                    )
+                    processed += len(batch)
+                    if progress:
+                        progress("fetch", processed, len(vacancies_obj))
+                    batch = []
+                if data is None:
+                    return
+
+    fv = ApiHH.FetchVacancies()
+    writer_task = asyncio.create_task(writer())
+    fetch_task = asyncio.create_task(fv.fetch_vacancies(vacancies_obj, output=queue))
+    tasks = [writer_task, fetch_task]
+    try:
+        # Если запись упала, то загрузка навсегда заблокируется на полной очереди,
+        # поэтому ждём обе задачи, а не только загрузку
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        if not writer_task.done():
+            # Загрузка закончилась, записываем оставшиеся вакансии.
+            # Конец очереди отправляем отдельной задачей: запись может упасть,
+            # не дочитав очередь
+            tasks.append(asyncio.create_task(queue.put(None)))
+            await asyncio.wait([writer_task])
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    # Ошибка записи важнее: после неё загрузка отменена
+    writer_task.result()
+    fetch_task.result()
+
+    elapsed = time.perf_counter() - start
+    logger.info(
+        f"Saved {saved} vacancies in {elapsed:.2f} s, "
+        f"{saved / elapsed if elapsed else 0:.0f} rows/s"
+    )
+    return fv
+
+
+def converting_vacancies_by_db(
+    path: Path = vacancies_text_ndjson_path,
+    batch_size: int = db_batch_size,
+    convert_workers: int = convert_process_workers,
+):
+    """
+    Преобразуем данные из файла с вакансиями, в нужный формат для БД.
+
+    Используется для повторной загрузки вакансий из NDJSON файла,
+    который пишет `stream_vacancies_to_db`.
+    Вакансии преобразуются в `convert_workers` процессах.
+    """
+    start = time.perf_counter()
+    saved = 0
+
+    def save_batch(batch: list[dict[str, Any]]) -> int:
+        if pool is None:
+            return save_vacancies_to_db(*convert_vacancies(batch), batch_size)
+        rows: list[dict[str, Any]] = []
+        errors: dict[int, str] = {}
+        for chunk_rows, chunk_errors in pool.map(
+            convert_vacancies, split_chunks(batch, convert_chunk_size)
+        ):
+            rows.extend(chunk_rows)
+            errors.update(chunk_errors)
+        return save_vacancies_to_db(rows, errors, batch_size)
 
-            # Сохранение изменений в базе данных
-            try:
-                session.commit()
-            except IntegrityError:
-                session.rollback()
-                logger.error(f"Ошибка при сохранении вакансии с id {data['id']}")
+    with path.open() as file:
+        count = sum(1 for line in file if line.strip())
+    batch: list[dict[str, Any]] = []
+    with create_convert_pool(convert_workers, count) as pool, path.open() as file:
+        for line in file:
+            if line.strip():
+                batch.append(json.loads(line))
+            if len(batch) >= batch_size:
+                saved += save_batch(batch)
+                batch = []
+        if batch:
+            saved += save_batch(batch)
 
+    elapsed = time.perf_counter() - start
+    logger.info(
+        f"Saved {saved} vacancies in {elapsed:.2f} s, "
+        f"{saved / elapsed if elapsed else 0:.0f} rows/s"
+    )
     logger.info("Success!: formatting_vacancies_text")
 
 
-def tokenize_vacancies_and_resumes_db():
+def load_tokenization_state(session: Session) -> list:
+    """Вакансии, на которые я не откликался, и их сохранённые результаты токенизации"""
+    return (
+        session.query(
+            Vacancy.id,
+            Vacancy.description,
+            TokenizationVacancy.token_ids,
+            TokenizationVacancy.description_hash,
+            TokenizationVacancy.resume_hash,
+            TokenizationVacancy.tokenized_at,
+        )
+        .outerjoin(TokenizationVacancy, TokenizationVacancy.id == Vacancy.id)
+        .filter(Vacancy.send_offer == False)  # noqa E712
+        .all()
+    )
+
+
+def tokenize_vacancies_and_resumes_db(
+    batch_size: int = db_batch_size, progress: Progress | None = None
+):
     """
     Токенизация вакансий и резюме, для последующий сохранения в бд.
+
+    Токенизируются только новые вакансии и вакансии с изменившимся описанием.
+    Если изменилось резюме, то оценки остальных вакансий пересчитываются
+    по уже сохранённым токенам.
+    Инвертированный индекс токенов обновляется для вакансий с новыми токенами,
+    частота токенов `token_frequency` - вместе с записью результатов.
+
+    Результаты сохраняются в БД пачками по `batch_size` записей.
     """
 
-    def save_response_to_db(response: TokenizationVacancy):
-        """Сохранить ответ в базе данных или обновить, если он уже существует"""
-        Session = sessionmaker(bind=BaseEngineSql)
-        with Session() as session:
-            try:
-                # Попробуем найти существующую запись
-                existing_response = (
-                    session.query(TokenizationVacancy).filter_by(id=response.id).one()
-                )
-                # Если запись найдена, обновляем её
-                existing_response.common_tokens = response.common_tokens
-                existing_response.len_common_tokens = response.len_common_tokens
-                existing_response.missing_tokens = response.missing_tokens
-                existing_response.len_missing_tokens = response.len_missing_tokens
-                existing_response.vacancy = response.vacancy
-                existing_response.score = response.score
-                logger.info(f"Response updated: {existing_response}")
-            except NoResultFound:
-                # Если запись не найдена, добавляем новую
-                session.add(response)
-                logger.warning(f"Response saved: {response}")
-            session.commit()
-
-    response: dict[int, TokenizationVacancy] = {}
     # Токенизация резюме
-    resume_tokens = TokenizationResumeAndVacancies.resume()
+    resume = TokenizationResumeAndVacancies.resume_cached()
+    resume_hash = resume.hash
+    resume_tokens = resume.tokens_set
+
+    # Вакансии, которые нужно токенизировать, и вакансии, которым нужно пересчитать оценку
+    job_descriptions_hash: dict[int, str] = {}
+    job_descriptions_new: dict[int, str] = {}
+    job_tokens: dict[int, list[str]] = {}
+    # Вакансии, которые нужно добавить в индекс токенов
+    job_tokens_index: dict[int, list[str]] = {}
+    tokenized_at: dict[int, datetime] = {}
+    Session = sessionmaker(bind=BaseEngineSql)
+    with Session() as session:
+        indexed_ids = indexed_vacancy_ids(session)
+        texts = token_texts(session)
+        rows = load_tokenization_state(session)
+    for id_, description, token_ids, description_hash, row_resume_hash, row_at in rows:
+        job_descriptions_hash[id_] = text_hash(description)
+        if token_ids is None or description_hash != job_descriptions_hash[id_]:
+            job_descriptions_new[id_] = description
+        else:
+            tokens = decode_tokens(token_ids, texts)
+            if row_resume_hash != resume_hash:
+                job_tokens[id_] = tokens
+                tokenized_at[id_] = row_at
+            if id_ not in indexed_ids:
+                job_tokens_index[id_] = tokens
+    logger.info(
+        f"Vacancies to tokenize: {len(job_descriptions_new)}, "
+        f"to rescore: {len(job_tokens)}, unchanged: "
+        f"{len(rows) - len(job_descriptions_new) - len(job_tokens)}"
+    )
+
     # Токенизация вакансий
-    job_tokens: dict[int, str] = TokenizationResumeAndVacancies.job_descriptions()[0]
-    for id_, job in job_tokens.items():
-        common_tokens: set = set(resume_tokens).intersection(set(job))
-        missing_tokens: set = set(job) - set(resume_tokens)
-        response[id_] = TokenizationVacancy(
-            id=id_,
-            common_tokens=json.dumps(
-                list(common_tokens), ensure_ascii=False
-            ),  # Преобразуем в строку
-            len_common_tokens=len(common_tokens),
-            vacancy=str(job),  # Преобразуем в строку
-            missing_tokens=json.dumps(
-                list(missing_tokens), ensure_ascii=False
-            ),  # Преобразуем в строку
-            len_missing_tokens=len(missing_tokens),
-            score=0.0,
+    if progress:
+        progress("tokenize", 0, len(job_descriptions_new))
+    now = datetime.now()
+    for id_, tokens in TokenizationResumeAndVacancies.texts(
+        job_descriptions_new
+    ).items():
+        job_tokens[id_] = tokens
+        job_tokens_index[id_] = tokens
+        tokenized_at[id_] = now
+    if progress:
+        progress("tokenize", len(job_descriptions_new), len(job_descriptions_new))
+
+    with Session() as session:
+        token_ids = intern_tokens(
+            session, (token for tokens in job_tokens.values() for token in tokens)
         )
+        session.commit()
+
+    response: list[dict[str, Any]] = []
+    for id_, job in job_tokens.items():
+        common_tokens: set = resume_tokens.intersection(job)
+        missing_tokens: set = set(job) - resume_tokens
         score = len(common_tokens) / len(job) if job else 0
-        response[id_].score = float(f"{score:.2f}")
-        # Сохраняем ответ в БД
-        save_response_to_db(response[id_])
+        response.append(
+            {
+                "id": id_,
+                "common_tokens": json.dumps(list(common_tokens), ensure_ascii=False),
+                "len_common_tokens": len(common_tokens),
+                "token_ids": pack_ints(token_ids[token] for token in job),
+                "missing_tokens": json.dumps(list(missing_tokens), ensure_ascii=False),
+                "len_missing_tokens": len(missing_tokens),
+                "score": float(f"{score:.2f}"),
+                "description_hash": job_descriptions_hash[id_],
+                "resume_hash": resume_hash,
+                "tokenized_at": tokenized_at[id_],
+            }
+        )
+
+    # Сохраняем ответ в БД
+    written = 0
 
+    def before_write(session: Session, batch: list[dict[str, Any]]):
+        nonlocal written
+        update_token_frequency(session, batch)
+        written += len(batch)
+        if progress:
+            progress("save", min(written, len(response)), len(response))
+
+    with Session() as session:
+        if is_token_frequency_empty(session):
+            # Заполняем частоту токенов по уже сохранённым результатам
+            rebuild_token_frequency(session)
+        saved = bulk_upsert(
+            session,
+            TokenizationVacancy,
+            response,
+            batch_size,
+            before_write=before_write,
+        )
+        if progress:
+            progress("index", 0, len(job_tokens_index))
+        update_token_index(session, job_tokens_index, batch_size)
+        if progress:
+            progress("index", len(job_tokens_index), len(job_tokens_index))
+    logger.info(f"Saved tokenization: {saved} of {len(response)}")
     logger.info("Success!: find_similar_vacancies")
@@ -1,95 +1,298 @@
 import asyncio
 import logging
+import random
+import time
 
 import aiohttp
-import requests
 
+from http_clients import client_session
+from settings_app import hh_max_concurrency, hh_requests_per_second, url_hh_api
 
 logger = logging.getLogger(__name__)
 
 
+class TokenBucket:
+    """
+    Ограничитель частоты запросов (token bucket).
+
+    Позволяет делать в среднем `rate` запросов в секунду,
+    с кратковременными всплесками до `capacity` запросов.
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Дождаться разрешения на один запрос"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated_at) * self.rate
+                )
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class AimdLimiter:
+    """
+    Ограничение количества одновременных запросов по принципу AIMD.
+
+    Пока сервер отвечает без ошибок, лимит плавно растет (примерно +1 за каждые
+    `limit` успешных запросов), при ошибке лимит уменьшается вдвое.
+    """
+
+    def __init__(self, initial: float = 3, min_limit: float = 1, max_limit: float = 20):
+        self.limit = float(min(initial, max_limit))
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self._in_flight = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        """Дождаться свободного места для запроса"""
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._in_flight < int(self.limit))
+            self._in_flight += 1
+
+    async def release(self, success: bool):
+        """Освободить место и скорректировать лимит по результату запроса"""
+        async with self._condition:
+            self._in_flight -= 1
+            if success:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            else:
+                self.limit = max(self.min_limit, self.limit / 2)
+            self._condition.notify_all()
+
+
+def retry_after_seconds(response: aiohttp.ClientResponse) -> float | None:
+    """Значение заголовка `Retry-After` в секундах, если он есть"""
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
+
+
 class ApiHH:
-    @staticmethod
-    def get_vacancies(salary, text, params_add, per_page=100, page=0):
-        """Получить список вакансий по указанному фильтру
+    class FetchVacanciesList:
+        """
+        Получить список вакансий по всем страницам.
 
         https://api.hh.ru/openapi/redoc#tag/Poisk-vakansij/operation/get-vacancies
         https://api.hh.ru/openapi/redoc#tag/Obshie-spravochniki/operation/get-dictionaries
+
+        Первая страница запрашивается отдельно, чтобы узнать количество страниц,
+        остальные запрашиваются параллельно через общую сессию
+        с ограничением частоты запросов.
         """
 
-        url = "https://api.hh.ru/vacancies"
+        # Статусы, при которых запрос нужно повторить
+        RETRY_STATUSES = {403, 429, 500, 502, 503, 504}
+
+        def __init__(
+            self,
+            base_url: str = url_hh_api,
+            requests_per_second: float = hh_requests_per_second,
+            max_retries: int = 5,
+            backoff: float = 1.0,
+        ):
+            self.base_url = base_url
+            self.rate_limiter = TokenBucket(requests_per_second)
+            self.max_retries = max_retries
+            self.backoff = backoff
+
+        async def fetch_page(
+            self, session: aiohttp.ClientSession, params: dict, page: int
+        ) -> dict:
+            """
+            Получить одну страницу списка вакансий, с повтором при ошибках.
 
-        params = {
-            "per_page": per_page,  # Количество вакансий на странице (максимум 100)
-            "page": page,
-            "text": text,  # Ваш поисковый запрос
-            "salary": str(salary),
-            **params_add,
-        }
+            Всего делается до `max_retries + 1` попыток, при `max_retries=0` - одна.
+            """
+            error: str | None = None
+            for attempt in range(self.max_retries + 1):
+                await self.rate_limiter.acquire()
+                try:
+                    async with session.get(
+                        f"{self.base_url}/vacancies", params={**params, "page": page}
+                    ) as response:
+                        if response.status not in self.RETRY_STATUSES:
+                            response.raise_for_status()
+                            return await response.json()
+                        delay = retry_after_seconds(response)
+                        error = f"status {response.status}"
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                    delay = None
+                    error = repr(e)
+                if attempt == self.max_retries:
+                    break
+                if delay is None:
+                    # Экспоненциальная задержка со случайной добавкой
+                    delay = self.backoff * 2**attempt * (1 + random.random())
+                logger.info(
+                    f"Page {page}, attempt {attempt + 1}: {error}, "
+                    f"retrying in {delay:.1f} seconds..."
+                )
+                await asyncio.sleep(delay)
+            raise RuntimeError(f"Max retries reached for page {page}: {error}")
 
-        response = requests.get(url, params=params)
-        vacancies = response.json()
-        return vacancies
+        async def fetch_vacancies(
+            self, salary, text, params_add, per_page=100
+        ) -> list[dict]:
+            params = {
+                "per_page": per_page,  # Количество вакансий на странице (максимум 100)
+                "text": text,  # Ваш поисковый запрос
+                "salary": str(salary),
+                **params_add,
+            }
+            async with client_session("hh") as session:
+                init_vacancies = await self.fetch_page(session, params, page=0)
+                logger.info(f"Pages: {init_vacancies['pages']}")
+                pages = await asyncio.gather(
+                    *(
+                        self.fetch_page(session, params, page)
+                        for page in range(1, init_vacancies["pages"])
+                    )
+                )
+            response = list(init_vacancies["items"])
+            for vacancies in pages:
+                response.extend(vacancies["items"])
+            return response
 
     class FetchVacancies:
-        """Получить текст вакансии по id"""
+        """
+        Получить текст вакансии по id.
 
-        def __init__(self):
-            # Для хранения ошибок
+        Вакансии загружаются пулом воркеров из общей очереди,
+        количество одновременных запросов регулирует `AimdLimiter`.
+        """
+
+        def __init__(
+            self,
+            base_url: str = url_hh_api,
+            max_concurrency: int = hh_max_concurrency,
+            requests_per_second: float = hh_requests_per_second,
+        ):
+            self.base_url = base_url
+            self.max_concurrency = max_concurrency
+            self.limiter = AimdLimiter(max_limit=max_concurrency)
+            self.rate_limiter = TokenBucket(requests_per_second)
+            # Для хранения ошибок: {"id": ID вакансии, "error": текст ошибки}
             self.error_list: list[dict] = []
+            # Статистика запросов
+            self.count_requests = 0
+            self.count_errors = 0
 
         async def fetch_vacancy(
-            self, session, url, vacancy_id: int, max_retries=3, time_sleep=40
+            self, session, url, vacancy_id: int, max_retries=3, backoff=2.0
         ):
             """
             Функция для получения текста вакансии.
 
             Если ошибка от сервера(из за превышения количества запросов),
-            то ждем time_sleep, и повторяем запрос до максимального количества попыток.
+            то ждем `Retry-After` или экспоненциальную задержку со случайной добавкой,
+            и повторяем запрос до максимального количества попыток.
             """
             for attempt in range(max_retries):
+                await self.rate_limiter.acquire()
+                await self.limiter.acquire()
+                delay = None
+                error = None
+                success = False
+                # Считаем попытки, а не ответы, чтобы доля ошибок была не больше 100%
+                self.count_requests += 1
                 try:
                     async with session.get(url) as response:
-                        res = await response.json()
-                        if error := res.get("errors"):
-                            logger.info(
-                                f"Attempt {attempt + 1}: Errors fetch_vacancy: {error}"
+                        if response.status == 404:
+                            # Вакансия удалена, повторять запрос бессмысленно
+                            success = True
+                            self.error_list.append(
+                                {"id": vacancy_id, "error": "not found"}
                             )
-                            if attempt < max_retries - 1:
-                                logger.info(f"Retrying in {time_sleep} seconds...")
-                                await asyncio.sleep(time_sleep)
-                            else:
-                                self.error_list.append({"id": vacancy_id})
-                                logger.info(
-                                    f"Max retries reached for vacancy {vacancy_id}"
-                                )
+                            logger.info(f"Vacancy {vacancy_id} not found")
+                            return None
+                        if response.status == 200:
+                            res = await response.json()
+                            if not (error := res.get("errors")):
+                                success = True
+                                return res
                         else:
-                            return res
+                            # Тело ответа при ошибке может быть не JSON
+                            delay = retry_after_seconds(response)
+                            error = f"status {response.status}"
+                        logger.info(
+                            f"Attempt {attempt + 1}: Errors fetch_vacancy: {error}"
+                        )
                 except Exception as e:
+                    error = repr(e)
                     logger.info(f"Attempt {attempt + 1}: Exception occurred: {str(e)}")
-                    if attempt < max_retries - 1:
-                        logger.info(f"Retrying in {time_sleep} seconds...")
-                        await asyncio.sleep(time_sleep)
-                    else:
-                        self.error_list.append({"id": vacancy_id})
-                        logger.info(f"Max retries reached for vacancy {vacancy_id}")
+                finally:
+                    # Освобождаем место и при отмене задачи
+                    await self.limiter.release(success)
+                self.count_errors += 1
+                if attempt < max_retries - 1:
+                    if delay is None:
+                        delay = backoff * 2**attempt * (1 + random.random())
+                    logger.info(f"Retrying in {delay:.1f} seconds...")
+                    await asyncio.sleep(delay)
+                else:
+                    self.error_list.append({"id": vacancy_id, "error": str(error)})
+                    logger.info(f"Max retries reached for vacancy {vacancy_id}")
             return None
 
-        async def fetch_vacancies(self, vacancies_obj, count_get=3):
+        async def fetch_vacancies(
+            self, vacancies_obj, output: asyncio.Queue | None = None
+        ):
+            """
+            Загрузить вакансии.
+
+            Если указана очередь `output`, то вакансии передаются в неё
+            по мере загрузки, а не накапливаются в возвращаемом списке.
+            """
             response = []
-            async with aiohttp.ClientSession() as session:
-                tasks = []
-                for i, v in enumerate(vacancies_obj):
-                    vacancy_id = v["id"]
-                    logger.info(f"Get {i} of {len(vacancies_obj)}")
-                    vacancy_url = f"https://api.hh.ru/vacancies/{vacancy_id}"
-                    tasks.append(
-                        asyncio.create_task(
-                            self.fetch_vacancy(session, vacancy_url, vacancy_id)
-                        )
-                    )
-                    if len(tasks) == count_get or i == len(vacancies_obj) - 1:
-                        results = await asyncio.gather(*tasks)
-                        response.extend([r for r in results if r is not None])
-                        tasks.clear()
+            queue: asyncio.Queue = asyncio.Queue()
+            for v in vacancies_obj:
+                queue.put_nowait(v["id"])
+            start = time.perf_counter()
+            count_done = 0
+
+            def log_progress():
+                elapsed = time.perf_counter() - start
+                logger.info(
+                    f"Get {count_done} of {len(vacancies_obj)}, "
+                    f"{self.count_requests / elapsed if elapsed else 0:.1f} req/s, "
+                    f"errors {self.count_errors / (self.count_requests or 1):.1%}, "
+                    f"concurrency {self.limiter.limit:.1f}"
+                )
+
+            async def worker():
+                nonlocal count_done
+                while True:
+                    try:
+                        vacancy_id = queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        return
+                    vacancy_url = f"{self.base_url}/vacancies/{vacancy_id}"
+                    result = await self.fetch_vacancy(session, vacancy_url, vacancy_id)
+                    # Ошибки загрузки сохраняются в `error_list`
+                    if result is not None:
+                        if output is not None:
+                            await output.put(result)
+                        else:
+                            response.append(result)
+                    count_done += 1
+                    if count_done % 100 == 0 and count_done < len(vacancies_obj):
+                        log_progress()
+
+            async with client_session("hh") as session:
+                await asyncio.gather(*(worker() for _ in range(self.max_concurrency)))
+            log_progress()
             return response
@@ -0,0 +1,120 @@
+"""
+Ранжирование вакансий по резюме на разреженной матрице документ-термин.
+
+- overlap - доля токенов вакансии, которые есть в резюме (прежняя оценка)
+- tfidf - косинусная близость TF-IDF векторов резюме и вакансии
+- bm25 - оценка Okapi BM25 вакансии по токенам резюме
+
+Матрица и IDF строятся один раз для набора токенов вакансий и кешируются,
+оценки всех вакансий считаются одним умножением матрицы на вектор резюме.
+"""
+
+from typing import Literal
+
+import numpy as np
+from scipy import sparse
+
+Scorer = Literal["overlap", "tfidf", "bm25"]
+
+
+class ScoringEngine:
+    """Оценка всех вакансий по токенам резюме"""
+
+    def __init__(
+        self, job_tokens: dict[int, list[str]], k1: float = 1.5, b: float = 0.75
+    ):
+        self.ids: list[int] = list(job_tokens)
+        self.vocabulary: dict[str, int] = {}
+        rows: list[int] = []
+        cols: list[int] = []
+        for row, tokens in enumerate(job_tokens.values()):
+            for token in tokens:
+                rows.append(row)
+                cols.append(self.vocabulary.setdefault(token, len(self.vocabulary)))
+        # Количество вхождений токена в вакансию, повторы суммируются при преобразовании
+        counts = sparse.coo_matrix(
+            (np.ones(len(rows), dtype=np.float64), (rows, cols)),
+            shape=(len(self.ids), len(self.vocabulary)),
+        ).tocsr()
+        count_docs = len(self.ids)
+        doc_len = np.asarray(counts.sum(axis=1)).ravel()
+        doc_freq = np.bincount(counts.indices, minlength=len(self.vocabulary))
+
+        self._counts = counts
+        self._doc_len = doc_len
+
+        # Бинарная матрица: какие токены есть в вакансии
+        self._presence = counts.copy()
+        self._presence.data[:] = 1
+
+        # TF-IDF, строки нормированы по L2
+        self.idf = np.log((1 + count_docs) / (1 + doc_freq)) + 1
+        tfidf = counts.multiply(self.idf).tocsr()
+        norms = np.sqrt(np.asarray(tfidf.multiply(tfidf).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        self._tfidf = sparse.diags(1 / norms) @ tfidf
+
+        # BM25, вес каждого токена вакансии считается заранее
+        idf_bm25 = np.log(1 + (count_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+        avg_len = doc_len.mean() if count_docs else 0
+        bm25 = counts.tocoo()
+        norm = k1 * (1 - b + b * doc_len[bm25.row] / (avg_len or 1))
+        bm25.data = idf_bm25[bm25.col] * bm25.data * (k1 + 1) / (bm25.data + norm)
+        self._bm25 = bm25.tocsr()
+
+    def _query_counts(self, tokens: list[str]) -> np.ndarray:
+        """Количество вхождений токенов резюме по словарю вакансий"""
+        query = np.zeros(len(self.vocabulary))
+        for token in tokens:
+            if (col := self.vocabulary.get(token)) is not None:
+                query[col] += 1
+        return query
+
+    def weighted_counts(self, weights: dict[str, float | int]) -> dict[int, float]:
+        """Сумма весов `weights` по всем вхождениям токенов в каждую вакансию"""
+        vector = np.zeros(len(self.vocabulary))
+        for token, weight in weights.items():
+            if (col := self.vocabulary.get(token)) is not None:
+                vector[col] = float(weight)
+        return dict(zip(self.ids, (self._counts @ vector).tolist()))
+
+    def score(self, resume_tokens: list[str], scorer: Scorer) -> dict[int, float]:
+        """Оценки всех вакансий по токенам резюме"""
+        query = self._query_counts(resume_tokens)
+        if scorer == "overlap":
+            # Количество уникальных общих токенов на количество токенов вакансии
+            scores = self._presence @ (query > 0).astype(np.float64)
+            scores = np.divide(
+                scores,
+                self._doc_len,
+                out=np.zeros_like(scores),
+                where=self._doc_len > 0,
+            )
+        elif scorer == "tfidf":
+            query = query * self.idf
+            query_norm = np.linalg.norm(query)
+            scores = self._tfidf @ (query / query_norm if query_norm else query)
+        elif scorer == "bm25":
+            scores = self._bm25 @ (query > 0).astype(np.float64)
+        else:
+            raise ValueError(f"Unknown scorer: {scorer}")
+        return dict(zip(self.ids, scores.tolist()))
+
+
+_engine: ScoringEngine | None = None
+_engine_tokens: dict[int, list[str]] | None = None
+
+
+def get_scoring_engine(job_tokens: dict[int, list[str]]) -> ScoringEngine:
+    """
+    Движок оценки для токенов вакансий, пересоздается только при их изменении.
+
+    Токены сравниваются по ссылке, без обхода всех токенов:
+    `utils.StoredJobTokens` возвращает тот же словарь, пока не изменилась
+    версия сохранённых токенов.
+    """
+    global _engine, _engine_tokens
+    if _engine is None or job_tokens is not _engine_tokens:
+        _engine = ScoringEngine(job_tokens)
+        _engine_tokens = job_tokens
+    return _engine
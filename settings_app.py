@@ -1,13 +1,71 @@
+import os
 from pathlib import Path
 from typing import Final
 
 base_path = Path(__file__).parent / "data"
 
 vacancies_json_path: Final[Path] = base_path / "vacancies.json"
-vacancies_text_json_path: Final[Path] = base_path / "vacancies_text.json"
-vacancies_error_json_path: Final[Path] = base_path / "vacancies_error_text.json"
+vacancies_text_ndjson_path: Final[Path] = base_path / "vacancies_text.ndjson"
+# Дописывать ответы API hh.ru в `vacancies_text_ndjson_path`, для отладки и повторной загрузки
+save_vacancies_text_ndjson: Final[bool] = False
 vacancies_db_path: Final[Path] = base_path / "vacancies.db"
 
 resume_text_path: Final[Path] = base_path / "resume_text.md"
 
 url_nlp_server: Final[str] = "http://localhost:8932/text_to_tokens"
+url_nlp_server_batch: Final[str] = "http://localhost:8932/texts_to_tokens"
+# Количество текстов в одном запросе к NLP серверу
+nlp_batch_size: Final[int] = 200
+# Количество процессов токенизации на NLP сервере
+nlp_process_workers: Final[int] = os.cpu_count() or 1
+# Кеш токенов клиента NLP сервера
+token_cache_db_path: Final[Path] = base_path / "token_cache.db"
+# Кеш токенов NLP сервера
+nlp_token_cache_db_path: Final[Path] = base_path / "nlp_token_cache.db"
+# Количество записей в LRU кеше токенов в памяти
+token_cache_memory_size: Final[int] = 10_000
+# Количество записей в одной транзакции при массовой записи в БД
+db_batch_size: Final[int] = 500
+# Количество id в одном запросе `IN (...)`, из-за ограничения SQLite на количество параметров
+db_in_chunk_size: Final[int] = 500
+
+url_hh_api: Final[str] = "https://api.hh.ru"
+# Максимальное количество запросов к API hh.ru в секунду
+hh_requests_per_second: Final[float] = 5
+# Максимальное количество одновременных запросов к API hh.ru
+hh_max_concurrency: Final[int] = 10
+# Максимальное количество неудачных попыток загрузки текста вакансии
+crawl_max_attempts: Final[int] = 5
+# Количество процессов для преобразования HTML описаний вакансий (0 - без пула процессов)
+convert_process_workers: Final[int] = os.cpu_count() or 1
+# Количество вакансий в одной задаче пула процессов преобразования
+convert_chunk_size: Final[int] = 25
+# Минимальное количество вакансий на один процесс преобразования,
+# при меньшем количестве вакансий пул не создаётся
+convert_pool_min_vacancies: Final[int] = 100
+
+# Общее количество соединений в пуле HTTP клиента
+http_connection_limit: Final[int] = 100
+# Максимальное количество соединений с NLP сервером
+nlp_max_connections: Final[int] = 10
+# Сколько секунд держать неиспользуемое соединение открытым
+http_keepalive_timeout: Final[float] = 60
+# Таймауты запросов (в секундах) к NLP серверу и к API hh.ru
+nlp_request_timeout: Final[float] = 300
+hh_request_timeout: Final[float] = 60
+
+# Соединения асинхронного движка БД для API: постоянные и дополнительные при нагрузке
+db_pool_size: Final[int] = 5
+db_max_overflow: Final[int] = 10
+# Сколько секунд ждать снятия блокировки БД другим соединением
+db_busy_timeout: Final[float] = 30
+
+# Настройки SQLite для каждого соединения
+# NORMAL в режиме WAL не теряет целостность БД, но быстрее FULL при записи
+db_synchronous: Final[str] = "NORMAL"
+# Размер кеша страниц в КиБ (отрицательное значение - в КиБ, а не в страницах)
+db_cache_size: Final[int] = -64_000
+# Сколько байт файла БД читать через mmap
+db_mmap_size: Final[int] = 256 * 1024 * 1024
+# Временные таблицы и индексы сортировки держать в памяти
+db_temp_store: Final[str] = "MEMORY"
@@ -0,0 +1,85 @@
+import sqlite3
+
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import Session
+
+from models import Base, decode_tokens, init_db, token_texts
+from token_index import find_phrase
+
+# Схема БД первой версии: токены вакансии списком строк в `tokenization.vacancy`
+BASELINE_SCHEMA = """
+CREATE TABLE vacancies (
+    id INTEGER PRIMARY KEY, experience VARCHAR(50), schedule VARCHAR(50),
+    employment VARCHAR(50), description TEXT, key_skills TEXT, employer_id INTEGER,
+    employer_name VARCHAR(100), employer_url VARCHAR(200), published_at DATETIME,
+    created_at DATETIME, initial_created_at DATETIME, salary_from INTEGER,
+    salary_to INTEGER, salary_currency TEXT, salary_gross BOOLEAN, type_open TEXT,
+    send_offer BOOLEAN
+);
+CREATE TABLE tokenization (
+    id INTEGER PRIMARY KEY, common_tokens TEXT, len_common_tokens INTEGER,
+    missing_tokens TEXT, len_missing_tokens INTEGER, vacancy TEXT, score FLOAT
+);
+INSERT INTO vacancies (id, description, key_skills, send_offer) VALUES
+    (1, 'Python developer', '["Python", "SQL"]', 0),
+    (2, 'Go developer', '', 0);
+INSERT INTO tokenization (id, common_tokens, missing_tokens, vacancy) VALUES
+    (1, '["python"]', '["developer"]', '["python", "developer"]'),
+    (2, '[]', '["go", "developer"]', "['go', 'developer']");
+"""
+
+
+def snapshot(engine) -> dict[str, list]:
+    """Все строки всех таблиц БД"""
+    with engine.connect() as conn:
+        return {
+            table.name: sorted(
+                conn.execute(text(f"SELECT * FROM {table.name}")).all(), key=repr
+            )
+            for table in Base.metadata.sorted_tables
+        }
+
+
+def test_init_db_migrates_baseline_schema_once(tmp_path):
+    path = tmp_path / "vacancies.db"
+    with sqlite3.connect(path) as conn:
+        conn.executescript(BASELINE_SCHEMA)
+    engine = create_engine(f"sqlite:///{path}")
+
+    init_db(engine)
+    migrated = snapshot(engine)
+    init_db(engine)
+
+    assert snapshot(engine) == migrated
+    with Session(engine) as session:
+        texts = token_texts(session)
+        job_tokens = {
+            id_: decode_tokens(token_ids, texts)
+            for id_, token_ids in session.execute(
+                text("SELECT id, token_ids FROM tokenization")
+            )
+        }
+        found = find_phrase(session, ["developer"])
+    assert job_tokens == {1: ["python", "developer"], 2: ["go", "developer"]}
+    assert found == {1: [1], 2: [1]}
+    assert sorted(migrated["vacancy_skill"]) == [(1, "Python"), (1, "SQL")]
+    assert {row[0]: row[2:] for row in migrated["token_frequency"]} == {
+        "python": (1, 0),
+        "developer": (0, 2),
+        "go": (0, 1),
+    }
+    columns = {column["name"] for column in inspect(engine).get_columns("tokenization")}
+    assert ("vacancy" in columns) == (sqlite3.sqlite_version_info < (3, 35, 0))
+    engine.dispose()
+
+
+def test_init_db_on_new_database_is_idempotent(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'vacancies.db'}")
+
+    init_db(engine)
+    created = snapshot(engine)
+    init_db(engine)
+
+    assert snapshot(engine) == created
+    assert created["data_version"] == [("tokenization", 0), ("vacancies", 0)]
+    engine.dispose()
@@ -0,0 +1,41 @@
+import random
+
+from phrase_matcher import PhraseMatcher
+
+
+def find_brute_force(phrases: list[list[str]], tokens: list[str]) -> set[int]:
+    """Номера словосочетаний, которые встречаются в токенах, перебором всех позиций"""
+    return {
+        number
+        for number, phrase in enumerate(phrases)
+        if any(
+            tokens[start : start + len(phrase)] == phrase
+            for start in range(len(tokens) - len(phrase) + 1)
+        )
+    }
+
+
+def test_phrase_matcher_matches_brute_force():
+    rng = random.Random(0)
+    # Маленький словарь, чтобы словосочетания пересекались и вкладывались друг в друга
+    vocabulary = ["a", "b", "c", "d"]
+    for _ in range(300):
+        phrases = [
+            [rng.choice(vocabulary) for _ in range(rng.randint(1, 4))]
+            for _ in range(rng.randint(1, 8))
+        ]
+        tokens = [rng.choice(vocabulary) for _ in range(rng.randint(0, 30))]
+        matcher = PhraseMatcher(
+            (phrase, number) for number, phrase in enumerate(phrases)
+        )
+
+        expected = find_brute_force(phrases, tokens)
+        assert matcher.find(tokens) == expected, (phrases, tokens)
+        assert matcher.score(tokens) == sum(expected)
+
+
+def test_phrase_matcher_compares_whole_tokens():
+    matcher = PhraseMatcher([(["от"], 1.0), (["python", "developer"], 2.0)])
+
+    assert matcher.find(["отдел", "python"]) == set()
+    assert matcher.find(["senior", "python", "developer", "от"]) == {0, 1}
@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+import receive_data
+from requests_to_external_services import ApiHH
+
+
+class FakeFetchVacancies:
+    """Загрузка вакансий без API hh.ru: все вакансии сразу попадают в очередь"""
+
+    def __init__(self):
+        self.error_list: list[dict] = []
+
+    async def fetch_vacancies(self, vacancies_obj, output: asyncio.Queue):
+        for vacancy in vacancies_obj:
+            await output.put(vacancy)
+
+
+async def convert_vacancies(pool, vacancies_text):
+    return vacancies_text, {}
+
+
+@pytest.fixture
+def fake_pipeline(monkeypatch):
+    """Конвейер загрузки без API hh.ru и преобразования HTML, возвращает записи в БД"""
+    monkeypatch.setattr(ApiHH, "FetchVacancies", FakeFetchVacancies)
+    monkeypatch.setattr(receive_data, "convert_vacancies_async", convert_vacancies)
+    saved: list[list[dict]] = []
+
+    def save_vacancies_to_db(rows, errors, batch_size):
+        saved.append(rows)
+        return len(rows)
+
+    monkeypatch.setattr(receive_data, "save_vacancies_to_db", save_vacancies_to_db)
+    return saved
+
+
+def stream(vacancies: list[dict]):
+    return asyncio.run(
+        asyncio.wait_for(
+            receive_data.stream_vacancies_to_db(
+                vacancies, batch_size=2, ndjson_path=None
+            ),
+            timeout=10,
+        )
+    )
+
+
+def test_stream_vacancies_saves_all_batches(fake_pipeline):
+    vacancies = [{"id": id_} for id_ in range(5)]
+    stream(vacancies)
+
+    assert [row for rows in fake_pipeline for row in rows] == vacancies
+    assert [len(rows) for rows in fake_pipeline] == [2, 2, 1]
+
+
+def test_stream_vacancies_fails_when_writer_fails(monkeypatch, fake_pipeline):
+    def save_vacancies_to_db(rows, errors, batch_size):
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(receive_data, "save_vacancies_to_db", save_vacancies_to_db)
+    # Вакансий больше, чем помещается в очередь, загрузка блокируется на записи
+    with pytest.raises(RuntimeError, match="database is locked"):
+        stream([{"id": id_} for id_ in range(20)])
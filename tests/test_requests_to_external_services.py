@@ -0,0 +1,149 @@
+import asyncio
+from collections import Counter
+
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from requests_to_external_services import ApiHH
+
+
+async def run_with_fake_hh(responses: dict[str, list], func):
+    """
+    Выполнить `func(base_url)` с фейковым API hh.ru.
+
+    `responses` - ответы по пути запроса, по одному на каждый запрос:
+    статус, (статус, тело) или None - не отвечать. Последний ответ повторяется.
+    Возвращает результат `func` и количество запросов по пути.
+    """
+    requests = Counter()
+
+    async def handler(request: web.Request) -> web.Response:
+        path = request.path
+        if path == "/vacancies":
+            path += f"?page={request.query['page']}"
+        answers = responses[path]
+        answer = answers[min(requests[path], len(answers) - 1)]
+        requests[path] += 1
+        if answer is None:
+            # Сервер не отвечает
+            await asyncio.Event().wait()
+        status, body = answer if isinstance(answer, tuple) else (answer, None)
+        if status == 200:
+            return web.json_response(body)
+        return web.Response(
+            status=status, text="Too many requests", headers={"Retry-After": "0"}
+        )
+
+    app = web.Application()
+    app.router.add_get("/{tail:.*}", handler)
+    server = TestServer(app)
+    await server.start_server()
+    try:
+        result = await func(str(server.make_url("")).rstrip("/"))
+    finally:
+        await server.close()
+    return result, requests
+
+
+def page(number: int, pages: int = 3) -> tuple[int, dict]:
+    return 200, {"pages": pages, "items": [{"id": str(number)}]}
+
+
+def fetch_list(base_url: str, max_retries: int = 5):
+    return ApiHH.FetchVacanciesList(
+        base_url, requests_per_second=1000, max_retries=max_retries, backoff=0
+    ).fetch_vacancies(100_000, "python", {})
+
+
+def test_fetch_vacancies_list_retries_throttled_pages():
+    responses = {
+        "/vacancies?page=0": [403, 429, page(0)],
+        "/vacancies?page=1": [503, page(1)],
+        "/vacancies?page=2": [page(2)],
+    }
+    vacancies, requests = asyncio.run(run_with_fake_hh(responses, fetch_list))
+
+    assert sorted(vacancy["id"] for vacancy in vacancies) == ["0", "1", "2"]
+    assert requests == {
+        "/vacancies?page=0": 3,
+        "/vacancies?page=1": 2,
+        "/vacancies?page=2": 1,
+    }
+
+
+def test_fetch_vacancies_list_does_not_retry_not_found():
+    responses = {"/vacancies?page=0": [404]}
+    with pytest.raises(aiohttp.ClientResponseError):
+        asyncio.run(run_with_fake_hh(responses, fetch_list))
+
+
+def test_fetch_vacancies_list_gives_up_after_max_retries():
+    responses = {"/vacancies?page=0": [429]}
+    with pytest.raises(RuntimeError, match="status 429"):
+        asyncio.run(
+            run_with_fake_hh(responses, lambda url: fetch_list(url, max_retries=3))
+        )
+
+
+def test_fetch_vacancies_list_without_retries():
+    responses = {"/vacancies?page=0": [page(0, pages=1)]}
+    vacancies, requests = asyncio.run(
+        run_with_fake_hh(responses, lambda url: fetch_list(url, max_retries=0))
+    )
+
+    assert [vacancy["id"] for vacancy in vacancies] == ["0"]
+    assert requests == {"/vacancies?page=0": 1}
+
+
+def test_fetch_vacancies_list_without_retries_makes_one_attempt():
+    responses = {"/vacancies?page=0": [429, page(0, pages=1)]}
+    with pytest.raises(RuntimeError, match="status 429"):
+        asyncio.run(
+            run_with_fake_hh(responses, lambda url: fetch_list(url, max_retries=0))
+        )
+
+
+def test_fetch_vacancies_retries_throttled_and_skips_not_found():
+    responses = {
+        "/vacancies/1": [429, (200, {"id": "1"})],
+        "/vacancies/2": [404],
+        "/vacancies/3": [503],
+    }
+    fv = ApiHH.FetchVacancies(max_concurrency=2, requests_per_second=1000)
+
+    async def fetch(base_url: str):
+        fv.base_url = base_url
+        return await fv.fetch_vacancies([{"id": id_} for id_ in (1, 2, 3)])
+
+    vacancies, requests = asyncio.run(run_with_fake_hh(responses, fetch))
+
+    assert vacancies == [{"id": "1"}]
+    assert requests == {"/vacancies/1": 2, "/vacancies/2": 1, "/vacancies/3": 3}
+    assert sorted(fv.error_list, key=lambda error: error["id"]) == [
+        {"id": 2, "error": "not found"},
+        {"id": 3, "error": "status 503"},
+    ]
+    assert fv.count_requests == 6
+    assert fv.count_errors == 4
+    assert fv.limiter._in_flight == 0
+    assert fv.limiter.limit < 2
+
+
+def test_fetch_vacancy_releases_limiter_on_cancel():
+    fv = ApiHH.FetchVacancies(max_concurrency=2, requests_per_second=1000)
+
+    async def fetch(base_url: str):
+        async with aiohttp.ClientSession() as session:
+            task = asyncio.create_task(
+                fv.fetch_vacancy(session, f"{base_url}/vacancies/1", 1)
+            )
+            await asyncio.sleep(0.2)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+    asyncio.run(run_with_fake_hh({"/vacancies/1": [None]}, fetch))
+
+    assert fv.limiter._in_flight == 0
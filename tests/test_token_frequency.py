@@ -0,0 +1,88 @@
+import json
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from models import TokenFrequency, TokenizationVacancy, bulk_upsert, init_db
+from token_frequency import count_tokens, update_token_frequency
+
+
+@pytest.fixture
+def session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'vacancies.db'}")
+    init_db(engine)
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
+
+
+def tokenization_row(id_: int, common: list[str], missing: list[str]) -> dict:
+    return {
+        "id": id_,
+        "common_tokens": json.dumps(common),
+        "missing_tokens": json.dumps(missing),
+    }
+
+
+def save(session: Session, rows: list[dict]):
+    bulk_upsert(session, TokenizationVacancy, rows, before_write=update_token_frequency)
+
+
+def stored_frequency(session: Session) -> dict[str, tuple[int, int]]:
+    return {
+        token: (common, missing)
+        for token, common, missing in session.execute(
+            select(
+                TokenFrequency.token,
+                TokenFrequency.common_count,
+                TokenFrequency.missing_count,
+            )
+        )
+    }
+
+
+def expected_frequency(session: Session) -> dict[str, tuple[int, int]]:
+    """Частота токенов, посчитанная заново по всем результатам токенизации"""
+    common, missing = count_tokens(
+        session.execute(
+            select(
+                TokenizationVacancy.common_tokens, TokenizationVacancy.missing_tokens
+            )
+        )
+    )
+    return {token: (common[token], missing[token]) for token in common | missing}
+
+
+def test_token_frequency_follows_description_change(session):
+    save(
+        session,
+        [
+            tokenization_row(1, ["python", "sql"], ["docker"]),
+            tokenization_row(2, ["python"], ["docker", "go"]),
+        ],
+    )
+    assert stored_frequency(session) == expected_frequency(session)
+
+    # Описание вакансии 2 изменилось: старые токены вычитаются, новые прибавляются
+    save(session, [tokenization_row(2, ["sql"], ["kafka"])])
+
+    assert stored_frequency(session) == expected_frequency(session)
+    assert stored_frequency(session) == {
+        "python": (1, 0),
+        "sql": (2, 0),
+        "docker": (0, 1),
+        "kafka": (0, 1),
+    }
+
+
+def test_token_frequency_same_batch_twice_is_unchanged(session):
+    rows = [
+        tokenization_row(1, ["python"], ["docker"]),
+        tokenization_row(2, ["python", "sql"], []),
+    ]
+    save(session, rows)
+    before = stored_frequency(session)
+    save(session, rows)
+
+    assert stored_frequency(session) == before == expected_frequency(session)
@@ -0,0 +1,130 @@
+"""
+Частота токенов по вакансиям.
+
+Таблица `token_frequency` хранит для каждого токена количество вакансий,
+в которых он общий с резюме и в которых он отсутствует в резюме.
+Таблица обновляется при каждой записи результатов токенизации,
+поэтому статистика частых скилов читается одним запросом.
+"""
+
+import json
+import logging
+import re
+from collections import Counter
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from models import TokenFrequency, TokenizationVacancy
+from settings_app import db_batch_size, db_in_chunk_size
+
+logger = logging.getLogger(__name__)
+
+_ENG_RE = re.compile(r"[a-zA-Z]")
+
+
+def token_lang(token: str) -> str:
+    """Язык токена: eng - если начинается с латинской буквы, иначе other"""
+    return "eng" if _ENG_RE.match(token) else "other"
+
+
+def count_tokens(rows) -> tuple[Counter, Counter]:
+    """Количество вакансий с каждым общим и отсутствующим токеном"""
+    common: Counter = Counter()
+    missing: Counter = Counter()
+    for common_tokens, missing_tokens in rows:
+        if common_tokens:
+            common.update(json.loads(common_tokens))
+        if missing_tokens:
+            missing.update(json.loads(missing_tokens))
+    return common, missing
+
+
+def load_tokens(session: Session, ids: list[int]) -> list[tuple[str, str]]:
+    """Общие и отсутствующие токены, которые сейчас сохранены для вакансий"""
+    rows = []
+    for start in range(0, len(ids), db_in_chunk_size):
+        rows.extend(
+            session.execute(
+                select(
+                    TokenizationVacancy.common_tokens,
+                    TokenizationVacancy.missing_tokens,
+                ).where(
+                    TokenizationVacancy.id.in_(ids[start : start + db_in_chunk_size])
+                )
+            )
+        )
+    return rows
+
+
+def apply_token_frequency(
+    session: Session,
+    common: Counter,
+    missing: Counter,
+    batch_size: int = db_batch_size,
+):
+    """Прибавить изменения количества вакансий к `token_frequency`"""
+    rows = [
+        {
+            "token": token,
+            "lang": token_lang(token),
+            "common_count": common[token],
+            "missing_count": missing[token],
+        }
+        for token in set(common) | set(missing)
+        if common[token] or missing[token]
+    ]
+    stmt = insert(TokenFrequency)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[TokenFrequency.token],
+        set_={
+            "common_count": TokenFrequency.common_count + stmt.excluded.common_count,
+            "missing_count": TokenFrequency.missing_count + stmt.excluded.missing_count,
+        },
+    )
+    for start in range(0, len(rows), batch_size):
+        session.execute(stmt, rows[start : start + batch_size])
+    # Токены, которых больше нет ни в одной вакансии
+    session.execute(
+        delete(TokenFrequency).where(
+            TokenFrequency.common_count <= 0, TokenFrequency.missing_count <= 0
+        )
+    )
+
+
+def update_token_frequency(session: Session, rows: list[dict]):
+    """
+    Учесть в `token_frequency` замену результатов токенизации на `rows`.
+
+    Вызывается до записи `rows` в `tokenization`, в той же транзакции:
+    из старых токенов вакансий вычитаются, новые прибавляются.
+    """
+    old_common, old_missing = count_tokens(
+        load_tokens(session, [row["id"] for row in rows])
+    )
+    common, missing = count_tokens(
+        (row["common_tokens"], row["missing_tokens"]) for row in rows
+    )
+    common.subtract(old_common)
+    missing.subtract(old_missing)
+    apply_token_frequency(session, common, missing)
+
+
+def rebuild_token_frequency(session: Session):
+    """Пересчитать `token_frequency` по всем результатам токенизации"""
+    session.execute(delete(TokenFrequency))
+    common, missing = count_tokens(
+        session.execute(
+            select(
+                TokenizationVacancy.common_tokens, TokenizationVacancy.missing_tokens
+            )
+        )
+    )
+    apply_token_frequency(session, common, missing)
+    session.commit()
+    logger.info(f"Token frequency rebuilt: {len(set(common) | set(missing))} tokens")
+
+
+def is_token_frequency_empty(session: Session) -> bool:
+    return not session.scalar(select(func.count()).select_from(TokenFrequency))
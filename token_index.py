@@ -0,0 +1,102 @@
+"""
+Инвертированный индекс по токенам вакансий.
+
+Для каждого токена из словаря `tokens` хранится список вакансий,
+количество и позиции токена в них (`vacancy_token`),
+это позволяет искать вакансии по токенам и словосочетаниям
+за время, пропорциональное количеству совпадений, а не количеству вакансий.
+"""
+
+import logging
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+from models import (
+    Token,
+    VacancyToken,
+    intern_tokens,
+    pack_ints,
+    unpack_ints,
+)
+from settings_app import db_batch_size, db_in_chunk_size
+
+logger = logging.getLogger(__name__)
+
+
+def token_positions(tokens: list[str]) -> dict[str, list[int]]:
+    """Позиции каждого токена в списке токенов"""
+    positions: dict[str, list[int]] = {}
+    for position, token in enumerate(tokens):
+        positions.setdefault(token, []).append(position)
+    return positions
+
+
+def indexed_vacancy_ids(session: Session) -> set[int]:
+    """ID вакансий, которые уже есть в индексе"""
+    return set(session.scalars(select(VacancyToken.vacancy_id).distinct()))
+
+
+def update_token_index(
+    session: Session,
+    job_tokens: dict[int, list[str]],
+    batch_size: int = db_batch_size,
+):
+    """Заменить записи индекса для вакансий `job_tokens` и сохранить изменения"""
+    ids = list(job_tokens)
+    for start in range(0, len(ids), db_in_chunk_size):
+        session.execute(
+            delete(VacancyToken).where(
+                VacancyToken.vacancy_id.in_(ids[start : start + db_in_chunk_size])
+            )
+        )
+    token_ids = intern_tokens(
+        session, (token for tokens in job_tokens.values() for token in tokens)
+    )
+    rows = [
+        {
+            "vacancy_id": id_,
+            "token_id": token_ids[token],
+            "count": len(positions),
+            "positions": pack_ints(positions),
+        }
+        for id_, tokens in job_tokens.items()
+        for token, positions in token_positions(tokens).items()
+    ]
+    for start in range(0, len(rows), batch_size):
+        session.execute(insert(VacancyToken), rows[start : start + batch_size])
+    session.commit()
+    logger.info(f"Token index updated: {len(ids)} vacancies, {len(rows)} postings")
+
+
+def find_phrase(session: Session, phrase: list[str]) -> dict[int, list[int]]:
+    """
+    Найти вакансии, в которых токены `phrase` идут подряд.
+
+    Возвращает позиции начала словосочетания по ID вакансии.
+    """
+    if not phrase:
+        return {}
+    postings: dict[str, dict[int, set[int]]] = {token: {} for token in phrase}
+    for token, vacancy_id, positions in session.execute(
+        select(Token.text, VacancyToken.vacancy_id, VacancyToken.positions)
+        .join(VacancyToken, VacancyToken.token_id == Token.id)
+        .where(Token.text.in_(set(phrase)))
+    ):
+        postings[token][vacancy_id] = set(unpack_ints(positions))
+
+    # Вакансии, в которых есть все токены словосочетания
+    candidates = set.intersection(*(set(postings[token]) for token in phrase))
+    result: dict[int, list[int]] = {}
+    for vacancy_id in candidates:
+        starts = [
+            start
+            for start in sorted(postings[phrase[0]][vacancy_id])
+            if all(
+                start + offset in postings[token][vacancy_id]
+                for offset, token in enumerate(phrase[1:], start=1)
+            )
+        ]
+        if starts:
+            result[vacancy_id] = starts
+    return result
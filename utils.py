@@ -1,45 +1,276 @@
 import asyncio
+import hashlib
 import logging
-import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable
 
-import aiohttp
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import select
+from sqlalchemy.orm import Session, sessionmaker
 
-from models import BaseEngineSql, Vacancy
+from http_clients import client_session, run_sync
+from models import (
+    CHANGE_TRIGGERS,
+    AsyncSessionSql,
+    BaseEngineSql,
+    DataVersion,
+    TokenizationVacancy,
+    Vacancy,
+    decode_tokens,
+    token_texts,
+)
 from nlp.interface_client import (
     client_api_text_to_tokens,
     client_api_text_to_tokens_async,
+    client_api_texts_to_tokens_async,
 )
+from scoring import Scorer, ScoringEngine
 from settings_app import resume_text_path
 
 log = logging.getLogger(__name__)
 
 
-# Функция удаления часового пояса
-def utc_to_local(utc_dt: str):
-    return re.sub(r"\+.+", "", utc_dt)
-
-
 def set_to_dict(obj: set) -> dict:
     return {key: None for key in obj}
 
 
+def text_hash(text: str | None) -> str:
+    """Хеш текста, для отслеживания его изменений"""
+    return hashlib.sha256((text or "").encode()).hexdigest()
+
+
+@dataclass
+class ResumeTokens:
+    """Токены резюме и посчитанные по ним оценки вакансий"""
+
+    hash: str  # Хеш текста резюме
+    tokens: list[str]
+    tokens_set: frozenset[str]
+    # Оценки вакансий по способу оценки, для движка оценки `scores_engine`
+    scores: dict[Scorer, Any] = field(default_factory=dict)
+    scores_engine: ScoringEngine | None = None
+
+    def cached_scores(
+        self, engine: ScoringEngine, scorer: Scorer, compute: Callable[[], Any]
+    ) -> Any:
+        """Оценки вакансий `compute()`, которые считаются один раз для `engine`"""
+        if engine is not self.scores_engine:
+            # Изменились вакансии - старые оценки не нужны
+            self.scores = {}
+            self.scores_engine = engine
+        if scorer not in self.scores:
+            self.scores[scorer] = compute()
+        return self.scores[scorer]
+
+
+class ResumeCache:
+    """
+    Токены резюме в памяти процесса.
+
+    При каждом обращении проверяются время изменения и размер файла резюме,
+    если они изменились - хеш текста. Токенизировать резюме нужно,
+    только если текст резюме действительно изменился.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._entry: ResumeTokens | None = None
+        self._stat: tuple[int, int] | None = None
+
+    def check(self) -> tuple[ResumeTokens | None, str | None, tuple[int, int]]:
+        """
+        Актуальные токены резюме из кеша.
+
+        Если их нет, то возвращает текст резюме и состояние файла для `store`.
+        """
+        stat = self.path.stat()
+        file_stat = (stat.st_mtime_ns, stat.st_size)
+        if self._entry is not None and file_stat == self._stat:
+            return self._entry, None, file_stat
+        text = self.path.read_text(encoding="utf-8")
+        if self._entry is not None and text_hash(text) == self._entry.hash:
+            # Файл сохранён без изменений текста
+            self._stat = file_stat
+            return self._entry, None, file_stat
+        return None, text, file_stat
+
+    def store(
+        self, text: str, file_stat: tuple[int, int], tokens: list[str]
+    ) -> ResumeTokens:
+        self._entry = ResumeTokens(
+            hash=text_hash(text), tokens=tokens, tokens_set=frozenset(tokens)
+        )
+        self._stat = file_stat
+        log.info(f"Resume tokenized: {len(tokens)} tokens")
+        return self._entry
+
+
+resume_cache = ResumeCache(resume_text_path)
+
+
+def load_stored_job_tokens(
+    session: Session,
+) -> tuple[dict[int, list[str]], dict[int, str], dict[int, str]]:
+    """
+    Сохранённые токены вакансий, на которые я не откликался.
+
+    Возвращает актуальные токены, описания всех вакансий и описания вакансий,
+    для которых нет актуальных сохранённых токенов.
+    """
+    texts = token_texts(session)
+    rows = session.execute(
+        select(
+            Vacancy.id,
+            Vacancy.description,
+            TokenizationVacancy.token_ids,
+            TokenizationVacancy.description_hash,
+        )
+        .outerjoin(TokenizationVacancy, TokenizationVacancy.id == Vacancy.id)
+        .where(
+            # Не откликался на вакансию
+            Vacancy.send_offer
+            == False,  # noqa E712
+        )
+    ).all()
+
+    job_descriptions = {id_: description for id_, description, _, _ in rows}
+    job_tokens = {
+        id_: decode_tokens(token_ids, texts)
+        for id_, description, token_ids, description_hash in rows
+        if token_ids is not None
+        # Записи старых версий без хеша считаем актуальными
+        and description_hash in (None, text_hash(description))
+    }
+    not_tokenized = {
+        id_: description
+        for id_, description in job_descriptions.items()
+        if id_ not in job_tokens
+    }
+    return job_tokens, job_descriptions, not_tokenized
+
+
+def stored_tokens_version(session: Session) -> tuple:
+    """
+    Версия сохранённых токенов вакансий для `StoredJobTokens`.
+
+    Счётчики изменений `vacancies` и `tokenization` из `data_version`:
+    меняются при токенизации, загрузке новых или обновлённых вакансий
+    и при отклике на вакансию, в том числе вручную.
+    """
+    versions = dict(
+        session.execute(
+            select(DataVersion.name, DataVersion.version).where(
+                DataVersion.name.in_(CHANGE_TRIGGERS)
+            )
+        ).all()
+    )
+    return tuple(versions.get(table) for table in CHANGE_TRIGGERS)
+
+
+class StoredJobTokens:
+    """
+    Результат `load_stored_job_tokens` в памяти процесса.
+
+    Загрузка декодирует токены всех вакансий и хеширует все описания,
+    поэтому повторяется, только если изменилась `stored_tokens_version`.
+    Пока версия не меняется, возвращаются те же самые словари,
+    изменять их нельзя.
+    """
+
+    def __init__(self):
+        # Версия и результат `load_stored_job_tokens` для неё
+        self._entry: tuple[tuple, tuple[dict, dict, dict]] | None = None
+
+    def load(
+        self, session: Session
+    ) -> tuple[tuple, dict[int, list[str]], dict[int, str], dict[int, str]]:
+        """Версия, токены, описания вакансий и описания вакансий без токенов"""
+        version = stored_tokens_version(session)
+        entry = self._entry
+        if entry is None or entry[0] != version:
+            entry = (version, load_stored_job_tokens(session))
+            self._entry = entry
+            log.info(f"Loaded stored tokens of {len(entry[1][0])} vacancies")
+        return version, *entry[1]
+
+    def add_tokens(
+        self,
+        version: tuple,
+        job_tokens: dict[int, list[str]],
+        tokens: dict[int, list[str]],
+    ) -> dict[int, list[str]]:
+        """
+        Добавить к `job_tokens` токены вакансий без сохранённых токенов,
+        полученные от NLP сервера.
+
+        Если версия не изменилась, то результат запоминается,
+        чтобы не токенизировать эти вакансии при каждом запросе.
+        """
+        job_tokens = {**job_tokens, **tokens}
+        entry = self._entry
+        if entry is not None and entry[0] == version:
+            _, job_descriptions, not_tokenized = entry[1]
+            not_tokenized = {
+                id_: description
+                for id_, description in not_tokenized.items()
+                if id_ not in tokens
+            }
+            self._entry = (version, (job_tokens, job_descriptions, not_tokenized))
+        return job_tokens
+
+    def load_from_db(
+        self,
+    ) -> tuple[tuple, dict[int, list[str]], dict[int, str], dict[int, str]]:
+        Session = sessionmaker(bind=BaseEngineSql)
+        with Session() as session:
+            return self.load(session)
+
+
+stored_job_tokens = StoredJobTokens()
+
+
 class TokenizationResumeAndVacancies:
     """
     Токенизация резюме и вакансиями
     """
 
+    @staticmethod
+    def read_resume_text() -> str:
+        """Получить текст резюме из файла"""
+        return resume_text_path.read_text(encoding="utf-8")
+
     @staticmethod
     def resume():
         """
         Токенизация резюме
         """
+        return TokenizationResumeAndVacancies.resume_cached().tokens
+
+    @staticmethod
+    async def resume_async() -> list[str]:
+        """
+        Токенизация резюме
+        """
+        return (await TokenizationResumeAndVacancies.resume_cached_async()).tokens
 
-        def read_resume_text() -> str:
-            """Получить текст вакансии из файла"""
-            return resume_text_path.read_text(encoding="utf-8")
+    @staticmethod
+    def resume_cached() -> ResumeTokens:
+        """Токены резюме, NLP сервер вызывается только при изменении файла резюме"""
+        entry, text, stat = resume_cache.check()
+        if entry is None:
+            entry = resume_cache.store(text, stat, client_api_text_to_tokens(text))
+        return entry
 
-        return client_api_text_to_tokens(read_resume_text())
+    @staticmethod
+    async def resume_cached_async() -> ResumeTokens:
+        """Асинхронная версия `resume_cached`"""
+        # Чтение файла резюме не должно блокировать цикл событий
+        entry, text, stat = await asyncio.to_thread(resume_cache.check)
+        if entry is None:
+            async with client_session("nlp") as session:
+                tokens = await client_api_text_to_tokens_async(text, session)
+            entry = resume_cache.store(text, stat, tokens)
+        return entry
 
     @staticmethod
     def job_descriptions() -> tuple[dict[int, list[str]], dict[int, str]]:
@@ -58,16 +289,67 @@ class TokenizationResumeAndVacancies:
 
         job_descriptions = {job[0]: job[1] for job in job_descriptions}
 
-        async def process_all():
-            async with aiohttp.ClientSession() as session:
-                tasks = [
-                    client_api_text_to_tokens_async(description, session)
-                    for description in job_descriptions.values()
-                ]
-                results = await asyncio.gather(*tasks)
-            return {
-                id_: tokens
-                for (id_, _), tokens in zip(job_descriptions.items(), results)
-            }
+        return (
+            TokenizationResumeAndVacancies.texts(job_descriptions),
+            job_descriptions,
+        )
 
-        return asyncio.run(process_all()), job_descriptions
+    @staticmethod
+    def stored_job_descriptions() -> tuple[dict[int, list[str]], dict[int, str]]:
+        """
+        Токены вакансий из таблицы `tokenization`.
+
+        Через NLP сервер токенизируются только те вакансии,
+        для которых ещё нет сохранённых токенов или описание которых изменилось.
+        """
+        version, job_tokens, job_descriptions, not_tokenized = (
+            stored_job_tokens.load_from_db()
+        )
+        if not_tokenized:
+            log.info(f"Tokenize vacancies without stored tokens: {len(not_tokenized)}")
+            job_tokens = stored_job_tokens.add_tokens(
+                version,
+                job_tokens,
+                TokenizationResumeAndVacancies.texts(not_tokenized),
+            )
+
+        return job_tokens, job_descriptions
+
+    @staticmethod
+    async def stored_job_descriptions_async() -> (
+        tuple[dict[int, list[str]], dict[int, str]]
+    ):
+        """Асинхронная версия `stored_job_descriptions`"""
+        async with AsyncSessionSql() as session:
+            version, job_tokens, job_descriptions, not_tokenized = (
+                await session.run_sync(stored_job_tokens.load)
+            )
+        if not_tokenized:
+            log.info(f"Tokenize vacancies without stored tokens: {len(not_tokenized)}")
+            job_tokens = stored_job_tokens.add_tokens(
+                version,
+                job_tokens,
+                await TokenizationResumeAndVacancies.texts_async(not_tokenized),
+            )
+
+        return job_tokens, job_descriptions
+
+    @staticmethod
+    def texts(texts: dict[int, str]) -> dict[int, list[str]]:
+        """
+        Токенизация текстов через NLP сервер
+        """
+        if not texts:
+            return {}
+
+        return run_sync(lambda: TokenizationResumeAndVacancies.texts_async(texts))
+
+    @staticmethod
+    async def texts_async(texts: dict[int, str]) -> dict[int, list[str]]:
+        """
+        Токенизация текстов через NLP сервер
+        """
+        if not texts:
+            return {}
+        async with client_session("nlp") as session:
+            return await client_api_texts_to_tokens_async(texts, session)
@@ -0,0 +1,77 @@
+"""
+Преобразование вакансий из ответов API hh.ru в записи таблицы `vacancies`.
+
+Функции выполняются в процессах пула, поэтому модуль не импортирует
+приложение и БД: процесс пула импортирует только его и `markdownify`.
+"""
+
+import json
+import logging
+import re
+from datetime import datetime
+from typing import Any
+
+from markdownify import markdownify as md
+
+logger = logging.getLogger(__name__)
+
+
+# Функция удаления часового пояса
+def utc_to_local(utc_dt: str):
+    return re.sub(r"\+.+", "", utc_dt)
+
+
+def vacancy_row_from_json(data: dict[str, Any]) -> dict[str, Any]:
+    """Преобразовать вакансию из ответа API hh.ru в запись таблицы `vacancies`"""
+    salary = data.get("salary") or {}
+    key_skills = [skill["name"] for skill in data.get("key_skills", [])]
+    return {
+        "id": int(data["id"]),
+        "experience": data.get("experience", {}).get("name", ""),
+        "schedule": data.get("schedule", {}).get("name", ""),
+        "employment": data.get("employment", {}).get("name", ""),
+        "description": md(data.get("description", "")),
+        "key_skills": (
+            json.dumps(key_skills, ensure_ascii=False) if key_skills else ""
+        ),
+        "employer_id": data.get("employer", {}).get("id", None),
+        "employer_name": data.get("employer", {}).get("name", ""),
+        "employer_url": data.get("employer", {}).get("url", ""),
+        "published_at": datetime.fromisoformat(
+            utc_to_local(data.get("published_at", ""))
+        ),
+        "created_at": datetime.fromisoformat(utc_to_local(data.get("created_at", ""))),
+        "initial_created_at": datetime.fromisoformat(
+            utc_to_local(data.get("initial_created_at", ""))
+        ),
+        "salary_from": salary.get("from", None),
+        "salary_to": salary.get("to", None),
+        "salary_currency": salary.get("currency", None),
+        "salary_gross": salary.get("gross", None),
+        "type_open": data.get("type", {}).get("id", ""),
+    }
+
+
+def convert_vacancies(
+    vacancies_text: list[dict[str, Any]],
+) -> tuple[list[dict[str, Any]], dict[int, str]]:
+    """
+    Преобразовать вакансии из ответов API hh.ru в записи таблицы `vacancies`.
+
+    Выполняется в процессах пула, т.к. `md()` - медленный разбор HTML на Python.
+    Возвращает записи и ошибки преобразования по id вакансии.
+    """
+    rows: list[dict[str, Any]] = []
+    errors: dict[int, str] = {}
+    for data in vacancies_text:
+        # Если есть ошибки, то пропускаем итерацию
+        if data.get("errors"):
+            logger.warning(f"Error formatting_vacancies_text: {data.get('errors')}")
+            continue
+        try:
+            rows.append(vacancy_row_from_json(data))
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            logger.error(f"Ошибка при преобразовании вакансии {data.get('id')}: {e}")
+            if data.get("id"):
+                errors[int(data["id"])] = repr(e)
+    return rows, errors